@@ -1,3 +1,4 @@
+from django.conf import settings
 from netbox.plugins import PluginConfig
 from .version import __version__
 
@@ -5,6 +6,7 @@ from .version import __version__
 class QRCodeConfig(PluginConfig):
     name = 'netbox_qrcode'
     verbose_name = 'qrcode'
+    base_url = 'qrcode'
     description = 'Modified: Generate QR codes for the objects'
     version = __version__
     author = 'JOnas Rau, Nikolay Yuzefovich'
@@ -38,6 +40,7 @@ class QRCodeConfig(PluginConfig):
         'font_size': '3mm',
         'font_weight': 'normal',
         'font_color': 'black',
+        'font_file': None,
         
         ################################## 
         # QR-Code
@@ -51,7 +54,20 @@ class QRCodeConfig(PluginConfig):
         'qr_error_correction': 0,
         'qr_box_size': 4,
         'qr_border': 0,
+        'qr_format': 'png',
+
+        # QR-Code Image Cache
+        'cache_size': 1024,
+        'cache_backend': None,
+        'cache_timeout': 86400,
         
+        ################################## 
+        # Load the label only when it becomes visible on the page
+        'lazy_load': False,
+
+        # Direct print / PNG preview: 'auto' draws standard layouts directly, 'weasyprint' always renders the HTML
+        'print_renderer': 'auto',
+
         ################################## 
         # Label Layout
         
@@ -118,7 +134,61 @@ class QRCodeConfig(PluginConfig):
         "DEFAULT_PRINTER": "default",
         "DEFAULT_LABEL_SIZE": "62x100",
 
+        # Printer pools: name → list of printers from PRINTERS (selected with 'printer' of a label design)
+        "PRINTER_POOLS": {},
+        'printer_dispatch': 'round_robin',
+        'printer_timeout': 5,
+        'printer_retry_interval': 30,
+        'printer_max_jobs': 1,
+        'printer_queue_timeout': 60,
+        'printer_write_timeout': 30,
+        # Connections are kept per process: > 0 only for printers that accept several connections
+        'printer_keepalive': 0,
+
+        # Conversion for the printer: 'threshold', 'floyd_steinberg' or 'ordered' (threshold in percent as brother_ql)
+        'print_dither': 'threshold',
+        'print_threshold': 70,
+
+        # Timings and counters of the label pipeline (see metrics.py)
+        'metrics': True,
+        'metrics_prometheus': True,
+
+        # Print jobs: 'thread' (thread pool in the NetBox process), 'rq' (NetBox background workers) or None (synchronous)
+        'print_queue': 'thread',
+        'print_queue_name': 'default',
+        'print_workers': 2,
+
+        # Cache for rendered labels (PNG/PDF preview, REST API, export)
+        'render_cache_size': 128,
+        'render_cache_max_bytes': 64 * 1024 * 1024,
+        'render_cache_backend': None,
+        'render_cache_dir': None,
+        'render_cache_dir_max_bytes': 512 * 1024 * 1024,
+        'render_cache_timeout': 3600,
+
+        # Printer data (Brother raster) per label page, reprints only write to the printer
+        'raster_cache_size': 512,
+        'raster_cache_max_bytes': 32 * 1024 * 1024,
+        'raster_cache_backend': None,
+        'raster_cache_dir': None,
+        'raster_cache_dir_max_bytes': 256 * 1024 * 1024,
+        'raster_cache_timeout': 7 * 86400,
+
 
     }
 
+    def ready(self):
+        super().ready()
+
+        # Resolve and validate the label configurations and compile the user templates
+        # once at startup (configuration errors are reported immediately).
+        from .label_config import load_label_configs
+        from .template_cache import compile_config_templates
+        load_label_configs()
+        compile_config_templates(settings.PLUGINS_CONFIG.get(self.name, {}))
+
+        # Invalidate cached labels when an object (or an object in its label text) changes.
+        from .signals import connect_signals
+        connect_signals()
+
 config = QRCodeConfig # noqa E305
@@ -0,0 +1,11 @@
+from django.urls import path
+
+from . import views
+
+# Available under /api/plugins/qrcode/ (namespace plugins-api:netbox_qrcode-api)
+urlpatterns = [
+    path('labels/<str:model_name>/<int:pk>/<int:label_design_no>/<str:output>/', views.LabelAPIView.as_view(), name='label'),
+    path('export/<str:model_name>/<int:label_design_no>/<str:archive>/', views.ExportAPIView.as_view(), name='export'),
+    path('print-jobs/', views.PrintJobListAPIView.as_view(), name='print_jobs'),
+    path('print-jobs/<str:job_id>/', views.PrintJobAPIView.as_view(), name='print_job'),
+]
@@ -0,0 +1,131 @@
+from django.http import Http404, HttpResponse
+from django.urls import reverse
+from netbox.api.authentication import IsAuthenticatedOrLoginNotRequired
+from rest_framework import status
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.permissions import SAFE_METHODS, BasePermission
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from ..export import OUTPUTS, export_labels, get_label_file
+from ..jobs import enqueue_print_job, get_job_status
+from ..label_config import MODELS, get_label_design_numbers
+from ..views import get_plugin_instance
+
+# ******************************************************************************************
+# REST API of the plugin, e.g. for provisioning scripts:
+#   GET  labels/<model>/<id>/<label design>/<output>/  Label as file (see export.OUTPUTS)
+#   GET  export/<model>/<label design>/<zip|pdf>/      Labels of many objects (streamed)
+#   POST print-jobs/                                   Print labels of one or many objects
+#   GET  print-jobs/<job id>/                          Status of a print job
+# Only objects the user is allowed to view are returned or printed (like in the web views).
+# ******************************************************************************************
+
+##################################
+# Print jobs need an authenticated user, also if LOGIN_REQUIRED is disabled, and creating
+# them needs a token with write access (read-only tokens only see the status).
+# Logins in the browser (session) have no token.
+class PrintJobPermission(BasePermission):
+
+    def has_permission(self, request, view):
+        if not request.user.is_authenticated:
+            raise PermissionDenied('Print jobs require an authenticated user.')
+        if request.method not in SAFE_METHODS and not getattr(request.auth, 'write_enabled', True):
+            raise PermissionDenied('This API token is read-only.')
+        return True
+
+##################################
+# Returns a label of an object as file: QR code (PNG/SVG), rendered label (PNG/PDF) or the
+# printer data (Brother raster, ?printer_model=QL-820NWB, default: model of DEFAULT_PRINTER).
+class LabelAPIView(APIView):
+    permission_classes = [IsAuthenticatedOrLoginNotRequired]
+
+    def get(self, request, model_name, pk, label_design_no, output):
+        if output not in OUTPUTS:
+            raise Http404(f"Unknown output '{output}' (available: {', '.join(OUTPUTS)}).")
+
+        plugin = get_plugin_instance(request, model_name, pk)
+
+        if output == 'raster':
+            from brother_ql import BrotherQLError
+
+            printer_model = request.query_params.get('printer_model')
+            try:
+                content = get_label_file(request, plugin, label_design_no, output, printer_model)
+            except BrotherQLError as exc:
+                raise ValidationError({'printer_model': str(exc) or f"Unknown printer model '{printer_model}'."})
+        else:
+            content = get_label_file(request, plugin, label_design_no, output)
+
+        if content is None:
+            raise Http404(f"Label design {label_design_no} is not configured for '{model_name}'.")
+
+        content_type, extension = OUTPUTS[output]
+        response = HttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{model_name}_{pk}_{label_design_no}.{extension}"'
+        return response
+
+##################################
+# Streams the labels of all objects matching the filters of the query string (like the
+# REST API of the model, e.g. ?site_id=1) as ZIP archive (?output=png, qr.svg, ...) or as
+# one PDF. The response is sent while the labels are rendered.
+class ExportAPIView(APIView):
+    permission_classes = [IsAuthenticatedOrLoginNotRequired]
+
+    def get(self, request, model_name, label_design_no, archive):
+        return export_labels(request, model_name, label_design_no, archive, request.query_params.get('output', 'png'))
+
+##################################
+# Creates print jobs. The body is one job or a list of jobs:
+#   {"model": "device", "ids": [1, 2, 3], "label_design": 1}
+# All objects of one job are printed with one printer connection. Returns the jobs (id, status, url).
+class PrintJobListAPIView(APIView):
+    permission_classes = [PrintJobPermission]
+
+    def post(self, request):
+        entries = request.data if isinstance(request.data, list) else [request.data]
+        entries = [self.validate(entry) for entry in entries]
+
+        jobs = []
+        for model_name, pks, label_design_no in entries:
+            job = enqueue_print_job(request, model_name, pks, label_design_no)
+            job['url'] = request.build_absolute_uri(reverse('plugins-api:netbox_qrcode-api:print_job', args=[job['id']]))
+            jobs.append(job)
+
+        return Response(jobs, status=status.HTTP_202_ACCEPTED)
+
+    ##################################
+    # Checks one job of the body.
+    # Return:
+    #   (model_name, pks, label_design_no)
+    def validate(self, entry):
+        if not isinstance(entry, dict):
+            raise ValidationError('Each print job must be an object with model, ids and label_design.')
+
+        model_name = entry.get('model')
+        if model_name not in MODELS:
+            raise ValidationError({'model': f"Unknown model '{model_name}' (available: {', '.join(MODELS)})."})
+
+        label_design_no = entry.get('label_design', 1)
+        if label_design_no not in get_label_design_numbers(model_name):
+            raise ValidationError({'label_design': f"Label design {label_design_no} is not configured for '{model_name}'."})
+
+        pks = entry.get('ids')
+        if not isinstance(pks, list) or not pks or not all(isinstance(pk, int) for pk in pks):
+            raise ValidationError({'ids': 'A non-empty list of object IDs is required.'})
+
+        return model_name, pks, label_design_no
+
+##################################
+# Returns the status of a print job (queued, rendering, sending, done, failed).
+class PrintJobAPIView(APIView):
+    permission_classes = [PrintJobPermission]
+
+    def get(self, request, job_id):
+        job = get_job_status(job_id)
+
+        # Only the user who created the job may see it.
+        if job is None or (job.get('user_id') != request.user.pk and not request.user.is_superuser):
+            raise Http404(f"Print job '{job_id}' not found.")
+
+        return Response(job)
@@ -0,0 +1,307 @@
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import InvalidCacheBackendError
+from netbox.plugins.utils import get_plugin_config
+
+from .metrics import increment
+
+logger = logging.getLogger('netbox_qrcode')
+
+# ******************************************************************************************
+# Content-addressed caches for generated content (e.g. QR code images, rendered labels).
+# Tier 1 is a bounded in-process LRU, tier 2 an optional Django cache backend (Redis, locmem, ...)
+# or a directory on disk.
+# ******************************************************************************************
+
+_MISSING = object()
+
+##################################
+# Creates a stable cache key from any number of values.
+# --------------------------------
+# Parameter:
+#   *parts: Values that uniquely describe the cached content (e.g. payload text, qr settings).
+def make_key(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(repr(part).encode('utf-8'))
+        digest.update(b'\x1f') # Separator, so that ('ab', 'c') != ('a', 'bc')
+    return digest.hexdigest()
+
+##################################
+# Thread-safe LRU dictionary with a maximum number of entries and optionally a maximum
+# total size in bytes (len() of the values, e.g. for PNG/PDF bytes).
+class LRUCache:
+
+    def __init__(self, maxsize, maxbytes=None):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.nbytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _sizeof(self, value):
+        return len(value) if self.maxbytes else 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+                return self._data[key]
+            except KeyError:
+                return default
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        size = self._sizeof(value)
+        if self.maxbytes and size > self.maxbytes:
+            return # Would displace everything else
+        with self._lock:
+            if key in self._data:
+                self.nbytes -= self._sizeof(self._data.pop(key))
+            self._data[key] = value
+            self.nbytes += size
+            while len(self._data) > self.maxsize or (self.maxbytes and self.nbytes > self.maxbytes):
+                _, evicted = self._data.popitem(last=False)
+                self.nbytes -= self._sizeof(evicted)
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._data:
+                self.nbytes -= self._sizeof(self._data.pop(key))
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+##################################
+# Cache in a directory, one file per entry. Used like a Django cache (get/set/delete).
+# Expired entries are removed on access. The size of the directory is kept as a running
+# total; only when it exceeds maxbytes the directory is scanned once and the oldest entries
+# are removed down to 90 % of maxbytes (so not every write leads to a scan). Writes of other
+# processes are only counted at the next scan.
+class DiskCache:
+
+    LOW_WATER = 0.9
+
+    def __init__(self, directory, maxbytes=None):
+        self.directory = directory
+        self.maxbytes = maxbytes
+        self._nbytes = None # Unknown until the first write
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(key.encode('utf-8')).hexdigest())
+
+    def _size(self, path):
+        try:
+            return os.stat(path).st_size
+        except FileNotFoundError:
+            return 0
+
+    def get(self, key, default=None):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as fh:
+                expires, value = pickle.load(fh)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return default
+        if expires and expires < time.time():
+            self.delete(key)
+            return default
+        return value
+
+    def set(self, key, value, timeout=None):
+        expires = time.time() + timeout if timeout else None
+        path = self._path(key)
+        replaced = self._size(path) if self.maxbytes else 0
+
+        # Write to a temporary file first, so that no process reads a half-written entry.
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'wb') as fh:
+            pickle.dump((expires, value), fh, pickle.HIGHEST_PROTOCOL)
+            written = fh.tell()
+        os.replace(tmp_path, path)
+
+        if self.maxbytes:
+            with self._lock:
+                if self._nbytes is None:
+                    self._nbytes = self._scan_size()
+                else:
+                    self._nbytes += written - replaced
+                over = self._nbytes > self.maxbytes
+            if over:
+                self._cull()
+
+    def delete(self, key):
+        path = self._path(key)
+        size = self._size(path) if self.maxbytes else 0
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        with self._lock:
+            if self._nbytes is not None:
+                self._nbytes -= size
+
+    def _entries(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue # Removed by another process
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _cull(self):
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.maxbytes * self.LOW_WATER
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        with self._lock:
+            self._nbytes = total
+
+##################################
+# Two-tier cache for one kind of content (namespace).
+# The settings are read from the plugin configuration on first use (<prefix> e.g. 'cache'):
+#   <prefix>_size:      Maximum entries of the in-process LRU tier (0 = disabled).
+#   <prefix>_max_bytes: Maximum total size of the in-process LRU tier (None = only entries count).
+#   <prefix>_backend:   Alias of a Django cache from CACHES (None = disabled).
+#   <prefix>_dir:       Directory for a cache on disk, used if no backend is set (None = disabled).
+#   <prefix>_dir_max_bytes: Maximum total size of the directory (None = unlimited).
+#   <prefix>_timeout:   TTL in seconds for the second tier.
+class ContentCache:
+
+    def __init__(self, namespace, prefix='cache'):
+        self.namespace = namespace
+        self.prefix = prefix
+        self._local = None
+        self._backend = _MISSING
+        self._timeout = None
+        self._lock = threading.Lock()
+        self.hits = {'local': 0, 'backend': 0}
+        self.misses = 0
+
+    def _setting(self, name, default=None):
+        return get_plugin_config('netbox_qrcode', f'{self.prefix}_{name}', default)
+
+    def _setup(self):
+        with self._lock:
+            if self._local is not None:
+                return
+            self._timeout = self._setting('timeout', 86400)
+            alias = self._setting('backend')
+            directory = self._setting('dir')
+            backend = None
+            if alias:
+                try:
+                    backend = caches[alias]
+                except InvalidCacheBackendError:
+                    logger.warning("netbox_qrcode: cache backend '%s' is not configured in CACHES.", alias)
+            elif directory:
+                backend = DiskCache(directory, self._setting('dir_max_bytes'))
+            self._backend = backend
+            self._local = LRUCache(self._setting('size', 1024), self._setting('max_bytes'))
+
+    def _backend_key(self, key):
+        return f'netbox_qrcode:{self.namespace}:{key}'
+
+    ##################################
+    # Returns the cached value or None.
+    def get(self, key):
+        self._setup()
+
+        value = self._local.get(key, _MISSING)
+        if value is not _MISSING:
+            self.hits['local'] += 1
+            increment('cache_hits', namespace=self.namespace, tier='local')
+            return value
+
+        if self._backend is not None:
+            value = self._backend.get(self._backend_key(key), _MISSING)
+            if value is not _MISSING:
+                self.hits['backend'] += 1
+                increment('cache_hits', namespace=self.namespace, tier='backend')
+                self._local.set(key, value) # Promote into the local tier
+                return value
+
+        self.misses += 1
+        increment('cache_misses', namespace=self.namespace)
+        return None
+
+    def set(self, key, value):
+        self._setup()
+        self._local.set(key, value)
+        if self._backend is not None:
+            self._backend.set(self._backend_key(key), value, self._timeout)
+
+    def delete(self, key):
+        self._setup()
+        self._local.delete(key)
+        if self._backend is not None:
+            self._backend.delete(self._backend_key(key))
+
+    ##################################
+    # Returns the cached value, or creates it with the producer and stores it.
+    # --------------------------------
+    # Parameter:
+    #   key: Key from make_key()
+    #   producer: Function without parameters that creates the value on a cache miss.
+    def get_or_create(self, key, producer):
+        value = self.get(key)
+        if value is None:
+            value = producer()
+            self.set(key, value)
+        return value
+
+    ##################################
+    # Hit/miss counters of this process, e.g. for logging or monitoring.
+    def stats(self):
+        self._setup()
+        return {
+            'namespace': self.namespace,
+            'hits_local': self.hits['local'],
+            'hits_backend': self.hits['backend'],
+            'misses': self.misses,
+            'size_local': len(self._local),
+            'bytes_local': self._local.nbytes,
+        }
+
+    def clear(self):
+        self._setup()
+        self._local.clear()
+        self.hits = {'local': 0, 'backend': 0}
+        self.misses = 0
+
+# Cache for the QR code images (key: payload text + qr_* settings)
+qr_cache = ContentCache('qr')
+
+# Cache for rendered labels, PNG and PDF bytes (key: label HTML + page size + output kind)
+render_cache = ContentCache('render', prefix='render_cache')
+
+# Cache for the printer data of one label page (key: label content + printer model + label code)
+raster_cache = ContentCache('raster', prefix='raster_cache')
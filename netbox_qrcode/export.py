@@ -0,0 +1,286 @@
+import logging
+import zipfile
+import zlib
+from io import BytesIO
+
+from django.apps import apps
+from django.http import Http404, StreamingHttpResponse
+from django.utils.module_loading import import_string
+
+from .cache import make_key, render_cache
+from .label_config import get_label_config
+from .prefetch import prefetch_label_objects
+from .signals import get_label_key
+from .template_content import QRCode
+from .template_content_functions import config_for_modul, create_QRFile
+
+logger = logging.getLogger('netbox_qrcode')
+
+# ******************************************************************************************
+# Labels as files (REST API) and export of the labels of many objects, e.g. for a print shop.
+# The export walks the (filtered) queryset in chunks and streams the files while they are
+# rendered, so the memory use does not depend on the number of objects:
+#   zip: ZIP archive with one file per object (see OUTPUTS)
+#   pdf: One PDF with one page per label (300 dpi images of the labels)
+# ******************************************************************************************
+
+# Output -> (content type, file extension)
+OUTPUTS = {
+    'qr.png': ('image/png', 'qr.png'),
+    'qr.svg': ('image/svg+xml', 'qr.svg'),
+    'png': ('image/png', 'png'),
+    'pdf': ('application/pdf', 'pdf'),
+    'raster': ('application/octet-stream', 'bin'),
+}
+
+ARCHIVES = {
+    'zip': 'application/zip',
+    'pdf': 'application/pdf',
+}
+
+##################################
+# Returns one label of an object as file content.
+# --------------------------------
+# Parameter:
+#   request: HTML Request Information (host of the QR code URL)
+#   plugin: Template extension of the object (see views.create_plugin_instance)
+#   label_design_no: Which label design should be loaded.
+#   output: Key of OUTPUTS
+#   printer_model: Brother model for 'raster' (None = model of DEFAULT_PRINTER)
+# Return:
+#   Bytes or None if the label design is not configured.
+def get_label_file(request, plugin, label_design_no, output, printer_model=None):
+    config = config_for_modul(plugin, label_design_no)
+    if config is None:
+        return None
+
+    if output in ('qr.png', 'qr.svg'):
+        _, url, _, _ = QRCode.Create_LabelData(plugin, label_design_no)
+        return create_QRFile(url, config, output.removeprefix('qr.'))
+
+    from .printing import _get_printer_cfg, label_instructions
+
+    p_cfg, label_code = _get_printer_cfg()
+    key = get_label_key(plugin.context['object'], config, label_design_no, request.get_host())
+
+    # Printer data are cached like for printing.
+    if output == 'raster':
+        return label_instructions(
+            [(key, lambda: QRCode.Create_LabelOutput(plugin, label_design_no, 'image'))],
+            printer_model or p_cfg.get('MODEL'), label_code,
+        )
+
+    # The only cache of rendered labels (preview, REST API and export), see get_label_cache_key().
+    return render_cache.get_or_create(
+        get_label_cache_key(key, label_code, output),
+        lambda: QRCode.Create_LabelOutput(plugin, label_design_no, output),
+    )
+
+##################################
+# Cache key (and ETag of the preview) of a rendered label.
+# --------------------------------
+# Parameter:
+#   key: Key of the label from signals.get_label_key() (object version, label design, host)
+#   label_code: Label code of the printer (page size)
+#   output: 'png' or 'pdf'
+def get_label_cache_key(key, label_code, output):
+    return make_key(key, label_code, output)
+
+##################################
+# Returns the objects of a model the user is allowed to view, filtered with the filters of
+# the NetBox list view / REST API (e.g. ?site_id=1&status=active).
+def get_export_queryset(request, model_name):
+    model = apps.get_model('dcim', model_name)
+    queryset = model.objects.restrict(request.user, 'view')
+
+    filterset = import_string(f'dcim.filtersets.{model.__name__}FilterSet')
+    return filterset(request.GET, queryset, request=request).qs.order_by('pk')
+
+##################################
+# Creates the template extensions of the objects chunk by chunk.
+# The related objects of the label text are loaded for each chunk with one query per level.
+def _iter_plugins(request, model_name, queryset, label_design_no, chunk_size):
+    from .views import create_plugin_instance, get_template_extension # views imports this module
+
+    extension = get_template_extension(model_name)
+    prefetch_paths = get_label_config(model_name, label_design_no).prefetch_paths
+
+    chunk = []
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(obj)
+        if len(chunk) >= chunk_size:
+            prefetch_label_objects(chunk, prefetch_paths)
+            yield from (create_plugin_instance(request, extension, obj) for obj in chunk)
+            chunk = []
+    if chunk:
+        prefetch_label_objects(chunk, prefetch_paths)
+        yield from (create_plugin_instance(request, extension, obj) for obj in chunk)
+
+##################################
+# File-like object that collects the output of zipfile until it is sent.
+class _StreamBuffer:
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+##################################
+# Streams a ZIP archive with one file per object.
+def _stream_zip(request, model_name, plugins, label_design_no, output):
+    buffer = _StreamBuffer()
+    errors = []
+
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for plugin in plugins:
+            obj = plugin.context['object']
+            try:
+                content = get_label_file(request, plugin, label_design_no, output)
+            except Exception as exc:
+                logger.warning('netbox_qrcode: export of %s %s failed: %s', model_name, obj.pk, exc)
+                errors.append(f'{model_name} {obj.pk}: {exc}')
+                continue
+
+            # PNG and PDF are already compressed
+            compress_type = zipfile.ZIP_DEFLATED if output in ('qr.svg', 'raster') else zipfile.ZIP_STORED
+            archive.writestr(
+                f'{model_name}_{obj.pk}_{label_design_no}.{OUTPUTS[output][1]}', content, compress_type=compress_type
+            )
+            yield buffer.pop()
+
+        if errors:
+            archive.writestr('errors.txt', '\n'.join(errors))
+
+    yield buffer.pop()
+
+##################################
+# Writes a PDF object by object. Only the offsets of the objects are kept for the
+# cross-reference table, the pages are sent as soon as they are written.
+# Object 1 is the catalog, object 2 the page tree (both written at the end).
+class _PdfStream:
+
+    def __init__(self):
+        self.offset = 0
+        self.offsets = {}
+        self.page_ids = []
+        self.next_id = 3
+
+    def _write(self, data):
+        self.offset += len(data)
+        return data
+
+    def _object(self, obj_id, body):
+        self.offsets[obj_id] = self.offset
+        return self._write(f'{obj_id} 0 obj\n'.encode('ascii') + body + b'\nendobj\n')
+
+    def _stream(self, obj_id, header, data):
+        return self._object(
+            obj_id, f'<< {header} /Length {len(data)} >>\nstream\n'.encode('ascii') + data + b'\nendstream'
+        )
+
+    def header(self):
+        return self._write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    ##################################
+    # Writes a page with the label image (300 dpi) in the size of the label.
+    def page(self, img):
+        if img.mode == '1':
+            color_space, bits = 'DeviceGray', 1 # PIL and PDF: 1 = white
+        elif img.mode == 'L':
+            color_space, bits = 'DeviceGray', 8
+        else:
+            img = img.convert('RGB')
+            color_space, bits = 'DeviceRGB', 8
+
+        image_id, content_id, page_id = self.next_id, self.next_id + 1, self.next_id + 2
+        self.next_id += 3
+        self.page_ids.append(page_id)
+
+        width_pt, height_pt = img.width * 72 / 300, img.height * 72 / 300
+        return b''.join([
+            self._stream(
+                image_id,
+                f'/Type /XObject /Subtype /Image /Width {img.width} /Height {img.height} '
+                f'/ColorSpace /{color_space} /BitsPerComponent {bits} /Filter /FlateDecode',
+                zlib.compress(img.tobytes(), 6),
+            ),
+            self._stream(content_id, '', f'q {width_pt:.2f} 0 0 {height_pt:.2f} 0 0 cm /Label Do Q'.encode('ascii')),
+            self._object(page_id, (
+                f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width_pt:.2f} {height_pt:.2f}] '
+                f'/Resources << /XObject << /Label {image_id} 0 R >> >> /Contents {content_id} 0 R >>'
+            ).encode('ascii')),
+        ])
+
+    def trailer(self):
+        kids = ' '.join(f'{page_id} 0 R' for page_id in self.page_ids)
+        data = self._object(2, f'<< /Type /Pages /Kids [{kids}] /Count {len(self.page_ids)} >>'.encode('ascii'))
+        data += self._object(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+
+        xref_offset = self.offset
+        xref = [f'xref\n0 {self.next_id}\n', '0000000000 65535 f \n']
+        xref += [f'{self.offsets[obj_id]:010d} 00000 n \n' for obj_id in range(1, self.next_id)]
+        xref.append(f'trailer\n<< /Size {self.next_id} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n')
+        return data + ''.join(xref).encode('ascii')
+
+##################################
+# Streams one PDF with one page per label (rendered like the PNG preview).
+def _stream_pdf(request, model_name, plugins, label_design_no):
+    from PIL import Image
+
+    pdf = _PdfStream()
+    yield pdf.header()
+
+    for plugin in plugins:
+        obj = plugin.context['object']
+        try:
+            img = Image.open(BytesIO(get_label_file(request, plugin, label_design_no, 'png')))
+            img.load()
+        except Exception as exc:
+            logger.warning('netbox_qrcode: export of %s %s failed: %s', model_name, obj.pk, exc)
+            continue
+        yield pdf.page(img)
+
+    yield pdf.trailer()
+
+##################################
+# Creates the streaming response of an export.
+# --------------------------------
+# Parameter:
+#   request: HTML Request Information (user, filters in the query string)
+#   model_name: Model name without app label (e.g. device, rack, etc.)
+#   label_design_no: Which label design should be exported.
+#   archive: 'zip' or 'pdf'
+#   output: File format in the ZIP archive (key of OUTPUTS)
+#   chunk_size: Objects per database query
+def export_labels(request, model_name, label_design_no, archive, output='png', chunk_size=200):
+    from .views import get_template_extension
+
+    get_template_extension(model_name) # 404 for models without labels
+    if archive not in ARCHIVES:
+        raise Http404(f"Unknown export '{archive}' (available: {', '.join(ARCHIVES)}).")
+    if archive == 'zip' and output not in OUTPUTS:
+        raise Http404(f"Unknown output '{output}' (available: {', '.join(OUTPUTS)}).")
+    if get_label_config(model_name, label_design_no) is None:
+        raise Http404(f"Label design {label_design_no} is not configured for '{model_name}'.")
+
+    plugins = _iter_plugins(
+        request, model_name, get_export_queryset(request, model_name), label_design_no, chunk_size
+    )
+    if archive == 'zip':
+        content = _stream_zip(request, model_name, plugins, label_design_no, output)
+    else:
+        content = _stream_pdf(request, model_name, plugins, label_design_no)
+
+    response = StreamingHttpResponse(content, content_type=ARCHIVES[archive])
+    response['Content-Disposition'] = f'attachment; filename="{model_name}_labels_{label_design_no}.{archive}"'
+    return response
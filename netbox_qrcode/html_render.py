@@ -1,10 +1,11 @@
 from io import BytesIO
 from typing import Tuple
 from PIL import Image
-from django.contrib import messages
 
+from .metrics import increment, span
 
-def render_html_to_png(html: str, width_mm: int, height_mm: int, want_pdf=False) -> Image.Image:
+
+def _render_html(html: str, width_mm: int, height_mm: int, want_pdf=False) -> bytes:
     from weasyprint import HTML, CSS                       # Laufzeit-Import
 
     page_size = f"{width_mm}mm {height_mm}mm"
@@ -18,21 +19,70 @@ def render_html_to_png(html: str, width_mm: int, height_mm: int, want_pdf=False)
     import pypdfium2 as pdfium              # reines pip-Rad
 
     # 1. Rendern mit Stylesheet
-    doc = HTML(string=html).render(stylesheets=[css])
+    with span("weasyprint_layout"):
+        doc = HTML(string=html).render(stylesheets=[css])
 
     # 2. PDF daraus bauen
-    pdf_bytes = doc.write_pdf()
+    with span("weasyprint_pdf"):
+        pdf_bytes = doc.write_pdf()
 
-    pdf = pdfium.PdfDocument(pdf_bytes)
+    increment("renders", kind="pdf" if want_pdf else "png")
     if want_pdf:
         return pdf_bytes  # PDF zurückgeben, wenn gewünscht
 
-    page = pdf.get_page(0)
+    with span("pdfium_raster", kind="preview"):
+        pdf = pdfium.PdfDocument(pdf_bytes)
+        page = pdf.get_page(0)
+
+        # Rendere die Seite als 300dpi Bitmap
+        bitmap = page.render(scale=300 / 72)  # WeasyPrint gibt 72dpi aus, wir wollen 300dpi
+        pil_image = bitmap.to_pil()
+
+    # Als PNG ablegen, damit das Ergebnis gecacht werden kann (export.get_label_file)
+    with span("png_encode"):
+        buf = BytesIO()
+        pil_image.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def render_label_bytes(html: str, width_mm: int, height_mm: int, kind: str = "png") -> bytes:
+    """
+    Rendert das Label-HTML als PNG- oder PDF-Bytes (kind = "png" / "pdf").
+    Nicht gecacht: Vorschau, REST-API und Export cachen das fertige Label je
+    Objekt-Version (export.get_label_file), Nachdrucke die Druckerdaten.
+    """
+    return _render_html(html, width_mm, height_mm, want_pdf=(kind == "pdf"))
+
+
+def render_html_to_label_image(html: str, width_mm: float, height_mm: float,
+                               size_px: Tuple[int, int], grayscale: bool = True) -> Image.Image:
+    """
+    Rendert das Label direkt in der Druckgröße size_px = (Breite, Höhe) als
+    Graustufenbild (Modus "L", für zweifarbige Bänder grayscale=False → RGB).  pdfium rastert die PDF-Seite mit
+    passendem Maßstab und dreht sie dabei im Uhrzeigersinn ins Hochformat des
+    Brother-Labels – Resample und Drehung in PIL entfallen.  Rundungsreste
+    (höchstens ein Pixel) werden mit Weiß aufgefüllt bzw. abgeschnitten.
+    """
+    import pypdfium2 as pdfium
+
+    pdf_bytes = render_label_bytes(html, width_mm, height_mm, "pdf")
+    target_w, target_h = size_px
 
-    # Rendere die Seite als 300dpi Bitmap
-    bitmap = page.render(scale=300 / 72)  # WeasyPrint gibt 72dpi aus, wir wollen 300dpi
+    with span("pdfium_raster", kind="label"):
+        page = pdfium.PdfDocument(pdf_bytes).get_page(0)
+        page_w, page_h = page.get_size()  # pt (72 dpi)
 
+        # Querformat-Seite auf Hochformat-Label: beim Rastern um 90° drehen
+        rotation = 90 if (page_w > page_h) != (target_w > target_h) else 0
+        if rotation:
+            page_w, page_h = page_h, page_w
 
-    pil_image = bitmap.to_pil()
+        scale = min(target_w / page_w, target_h / page_h)
+        img = page.render(scale=scale, rotation=rotation, grayscale=grayscale).to_pil()
 
-    return pil_image
\ No newline at end of file
+    if img.size != size_px:
+        mode = "L" if grayscale else "RGB"
+        canvas = Image.new(mode, size_px, "white")
+        canvas.paste(img.convert(mode), ((target_w - img.width) // 2, (target_h - img.height) // 2))
+        img = canvas
+    return img
@@ -0,0 +1,172 @@
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import close_old_connections
+from netbox.plugins.utils import get_plugin_config
+
+logger = logging.getLogger('netbox_qrcode')
+
+# ******************************************************************************************
+# Print jobs: rendering and sending a label to the printer runs in the background,
+# so the web request never waits for the label printer.
+# Queues ('print_queue'):
+#   'rq':     NetBox background workers (python manage.py rqworker)
+#   'thread': Thread pool in the NetBox process
+#   None:     Synchronous in the web request (previous behaviour)
+# The status of a job is kept in the Django cache, so it can be queried from any process.
+# ******************************************************************************************
+
+QUEUED = 'queued'
+RENDERING = 'rendering'
+SENDING = 'sending'
+DONE = 'done'
+FAILED = 'failed'
+
+STATUS_TIMEOUT = 24 * 60 * 60
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _status_key(job_id):
+    return f'netbox_qrcode:printjob:{job_id}'
+
+##################################
+# Stores the status of a print job.
+# --------------------------------
+# Parameter:
+#   job_id: ID of the print job
+#   status: queued, rendering, sending, done or failed
+#   **extra: Additional information (e.g. error)
+def set_job_status(job_id, status, **extra):
+    job = cache.get(_status_key(job_id)) or {'id': job_id, 'created': time.time()}
+    job.update(extra, status=status, updated=time.time())
+    cache.set(_status_key(job_id), job, STATUS_TIMEOUT)
+    return job
+
+##################################
+# Returns the status of a print job or None if unknown/expired.
+def get_job_status(job_id):
+    return cache.get(_status_key(job_id))
+
+##################################
+# Creates the request for rendering outside of the web request.
+# The QR code URLs are built with the host of the original request.
+def _build_request(base_url, user_id):
+    from django.contrib.auth.models import AnonymousUser
+    from django.test import RequestFactory # Only needed in the worker
+
+    url = urlsplit(base_url)
+    request = RequestFactory().get('/', HTTP_HOST=url.netloc, secure=(url.scheme == 'https'))
+    # Without LOGIN_REQUIRED anonymous users can print too (user_id None).
+    request.user = get_user_model().objects.get(pk=user_id) if user_id is not None else AnonymousUser()
+    return request
+
+##################################
+# Executes a print job: renders the labels and sends them to the printer.
+# Runs in the background worker (rq), in the thread pool or synchronously.
+# --------------------------------
+# Parameter:
+#   job_id: ID of the print job
+#   payload: dict with model_name, pks, label_design_no, base_url and user_id
+#   request: Original request (only for synchronous jobs)
+def run_print_job(job_id, payload, request=None):
+    from .label_config import get_label_config
+    from .prefetch import prefetch_label_objects
+    from .printing import _get_printer_cfg, print_labels
+    from .signals import get_label_key
+    from .template_content import QRCode
+    from .views import get_plugin_instances
+
+    try:
+        set_job_status(job_id, RENDERING)
+        if request is None:
+            request = _build_request(payload['base_url'], payload['user_id'])
+
+        label_design_no = payload['label_design_no']
+        plugins = get_plugin_instances(request, payload['model_name'], payload['pks'])
+
+        # Related objects of all labels with one query per relation level.
+        config = get_label_config(payload['model_name'], label_design_no)
+        if config is not None:
+            prefetch_label_objects([plugin.context['object'] for plugin in plugins], config.prefetch_paths)
+
+        # Labels are only rendered if their printer data is not cached yet (reprints).
+        # The key describes the label content like the ETag of the preview.
+        labels = []
+        if config is not None:
+            for plugin in plugins:
+                key = get_label_key(plugin.context['object'], config, label_design_no, request.get_host())
+                labels.append((key, lambda plugin=plugin: QRCode.Create_LabelOutput(plugin, label_design_no, 'image')))
+
+        # All labels with one printer connection
+        set_job_status(job_id, SENDING, label_count=len(labels))
+        _, label_code = _get_printer_cfg()
+        printer = None
+        if labels:
+            printer = print_labels(labels, label_code, config.get('printer'))
+
+        return set_job_status(job_id, DONE, printer=printer)
+
+    except Exception as exc:
+        logger.exception('netbox_qrcode: print job %s failed', job_id)
+        return set_job_status(job_id, FAILED, error=str(exc))
+
+def _run_in_thread(job_id, payload):
+    try:
+        run_print_job(job_id, payload)
+    finally:
+        close_old_connections() # Threads keep their own database connection
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=get_plugin_config('netbox_qrcode', 'print_workers', 2),
+                thread_name_prefix='netbox_qrcode_print',
+            )
+    return _executor
+
+##################################
+# Queues a print job for one or more objects.
+# --------------------------------
+# Parameter:
+#   request: HTML Request Information (user and host)
+#   model_name: Model name without app label (e.g. device, rack, etc.)
+#   pks: IDs of the objects
+#   label_design_no: Which label design should be printed.
+# Return:
+#   Status of the job (dict with id and status)
+def enqueue_print_job(request, model_name, pks, label_design_no):
+    job_id = str(uuid.uuid4())
+    payload = {
+        'model_name': model_name,
+        'pks': list(pks),
+        'label_design_no': label_design_no,
+        'base_url': request.build_absolute_uri('/'),
+        'user_id': request.user.pk,
+    }
+    job = set_job_status(
+        job_id, QUEUED,
+        model_name=model_name, pks=payload['pks'], label_design_no=label_design_no, user_id=request.user.pk,
+    )
+
+    queue = get_plugin_config('netbox_qrcode', 'print_queue', 'thread')
+
+    if queue == 'rq':
+        from django_rq import get_queue
+        get_queue(get_plugin_config('netbox_qrcode', 'print_queue_name', 'default')).enqueue(
+            run_print_job, job_id, payload
+        )
+    elif queue == 'thread':
+        _get_executor().submit(_run_in_thread, job_id, payload)
+    else:
+        job = run_print_job(job_id, payload, request)
+
+    return job
@@ -0,0 +1,188 @@
+import re
+import threading
+from collections.abc import Mapping
+from types import MappingProxyType
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .cache import make_key
+from .prefetch import get_prefetch_paths
+from .text_fields import compile_text_fields
+
+# ******************************************************************************************
+# Resolved label configurations.
+# All combinations of model and label design (device, device_2 ... powerpanel_10) are merged
+# with the global configuration once at startup, validated and stored as immutable objects.
+# ******************************************************************************************
+
+# Models with label support (model name without app label)
+MODELS = ('device', 'module', 'rack', 'cable', 'location', 'powerfeed', 'powerpanel')
+
+# Label designs per model: model, model_2 ... model_10
+MAX_LABEL_DESIGNS = 10
+
+# Settings with a CSS length (e.g. '56mm', '2.20in')
+DIMENSION_KEYS = (
+    'font_size',
+    'label_qr_width', 'label_qr_height', 'label_qr_text_distance',
+    'label_width', 'label_height',
+    'label_edge_top', 'label_edge_left', 'label_edge_right', 'label_edge_bottom',
+)
+
+# Conversion factors of the supported units to mm
+_UNITS_MM = {'mm': 1.0, 'cm': 10.0, 'in': 25.4, 'pt': 25.4 / 72, 'px': 25.4 / 96}
+_DIMENSION_RE = re.compile(r'^\s*(\d+(?:\.\d*)?|\.\d+)\s*(mm|cm|in|pt|px)?\s*$')
+
+_CHOICES = {
+    'text_location': ('right', 'left', 'up', 'down'),
+    'qr_format': ('png', 'png_1bit', 'svg'),
+    'print_renderer': ('auto', 'weasyprint'),
+}
+
+##################################
+# Converts a CSS length into mm.
+# --------------------------------
+# Parameter:
+#   value: Length as number (mm) or string with unit (mm, cm, in, pt, px)
+# Return:
+#   Length in mm or None if the value cannot be converted (e.g. 'em' or calc()).
+def parse_dimension(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = _DIMENSION_RE.match(str(value))
+    if match is None:
+        return None
+    return float(match.group(1)) * _UNITS_MM[match.group(2) or 'mm']
+
+##################################
+# Immutable configuration of one label design of a model.
+# Behaves like the configuration dict (config.get('font_size') etc.).
+#   model: Model name (e.g. device)
+#   label_design_no: Label design (1 = 'device', 2 = 'device_2' etc.)
+#   dimensions: Lengths of DIMENSION_KEYS in mm (None if not convertible)
+#   hash: Hash of all values (changes whenever the configuration changes)
+#   text_field_accessors: Compiled entries of 'text_fields'
+#   prefetch_paths: Relation paths of 'text_fields' and the templates (see prefetch.py)
+class LabelConfig(Mapping):
+
+    def __init__(self, model, label_design_no, values):
+        self.model = model
+        self.label_design_no = label_design_no
+        self._values = MappingProxyType(dict(values))
+        self.hash = make_key(sorted((key, repr(value)) for key, value in values.items()))
+        self.dimensions = MappingProxyType({key: parse_dimension(values.get(key)) for key in DIMENSION_KEYS})
+        self.text_field_accessors = compile_text_fields(values.get('text_fields') or [])
+
+        # text_fields are only used for a text without text_template
+        text_fields = values.get('text_fields') or []
+        if not values.get('with_text') or values.get('text_template'):
+            text_fields = []
+        self.prefetch_paths = get_prefetch_paths(text_fields, (values.get('url_template'), values.get('text_template')))
+
+    def __getitem__(self, key):
+        return self._values[key]
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __repr__(self):
+        return f'<LabelConfig {config_name(self.model, self.label_design_no)}>'
+
+##################################
+# Name of the module configuration, e.g. ('device', 1) -> 'device', ('device', 2) -> 'device_2'
+def config_name(model, label_design_no):
+    if label_design_no >= 2:
+        return f'{model}_{label_design_no}'
+    return model
+
+##################################
+# Checks a resolved label configuration and raises ImproperlyConfigured on errors.
+# --------------------------------
+# Parameter:
+#   name: Name of the module configuration (for the error message)
+#   values: Merged configuration
+def validate_label_config(name, values):
+
+    for key, choices in _CHOICES.items():
+        if values.get(key) is not None and values.get(key) not in choices:
+            raise ImproperlyConfigured(
+                f"netbox_qrcode: '{name}.{key}' must be one of {', '.join(choices)} (is '{values.get(key)}')."
+            )
+
+    for key in ('with_text', 'with_qr'):
+        if not isinstance(values.get(key), bool):
+            raise ImproperlyConfigured(f"netbox_qrcode: '{name}.{key}' must be True or False.")
+
+    if not isinstance(values.get('text_fields', []), (list, tuple)):
+        raise ImproperlyConfigured(f"netbox_qrcode: '{name}.text_fields' must be a list.")
+
+    printer = values.get('printer')
+    known_printers = set(values.get('PRINTERS') or {}) | set(values.get('PRINTER_POOLS') or {})
+    for entry in printer if isinstance(printer, (list, tuple)) else [printer]:
+        if entry is not None and entry not in known_printers:
+            raise ImproperlyConfigured(
+                f"netbox_qrcode: '{name}.printer' must be a printer from PRINTERS or a pool from PRINTER_POOLS (is '{entry}')."
+            )
+
+    for key in DIMENSION_KEYS:
+        if values.get(key) in (None, ''):
+            raise ImproperlyConfigured(f"netbox_qrcode: '{name}.{key}' must not be empty.")
+
+##################################
+# Resolves all label configurations of all models.
+# --------------------------------
+# Parameter:
+#   plugin_config: Plugin configuration (PLUGINS_CONFIG['netbox_qrcode'])
+# Return:
+#   Dict {(model, label_design_no): LabelConfig}
+def build_label_configs(plugin_config):
+
+    label_configs = {}
+
+    for model in MODELS:
+        for label_design_no in range(1, MAX_LABEL_DESIGNS + 1):
+            name = config_name(model, label_design_no)
+            obj_cfg = plugin_config.get(name)
+
+            # Additional label designs must be numbered without gaps.
+            if label_design_no >= 2 and not obj_cfg:
+                break
+
+            values = dict(plugin_config)
+            values.update(obj_cfg or {}) # Override default config values
+
+            validate_label_config(name, values)
+            label_configs[(model, label_design_no)] = LabelConfig(model, label_design_no, values)
+
+    return label_configs
+
+_label_configs = None
+_lock = threading.Lock()
+
+##################################
+# Resolves the label configurations from the NetBox settings (called at startup).
+def load_label_configs():
+    global _label_configs
+    with _lock:
+        _label_configs = build_label_configs(settings.PLUGINS_CONFIG.get('netbox_qrcode', {}))
+    return _label_configs
+
+##################################
+# Returns the label configuration of a model and label design or None if not configured.
+# --------------------------------
+# Parameter:
+#   model: Model name (e.g. device)
+#   label_design_no: Which label design should be loaded.
+def get_label_config(model, label_design_no):
+    label_configs = _label_configs if _label_configs is not None else load_label_configs()
+    return label_configs.get((model, label_design_no))
+
+##################################
+# Returns the numbers of all configured label designs of a model (e.g. [1, 2, 3]).
+def get_label_design_numbers(model):
+    label_configs = _label_configs if _label_configs is not None else load_label_configs()
+    return [no for (name, no) in label_configs if name == model]
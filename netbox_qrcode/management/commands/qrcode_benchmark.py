@@ -0,0 +1,368 @@
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand, CommandError
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+
+from netbox_qrcode.version import __version__
+
+# ******************************************************************************************
+# Benchmark of the label pipeline: python manage.py qrcode_benchmark
+# Each stage (QR code, configuration, text, templates, rendering, printer conversion) is
+# measured separately with stub objects, so no database content is needed. The caches of
+# the plugin are bypassed, every run measures the full work of the stage.
+# The results can be written as JSON and compared with an earlier run (--baseline).
+# ******************************************************************************************
+
+# Modules of the rendering/printing stack, which must not be imported at startup
+# (they are loaded on the first preview or print).
+_HEAVY_MODULES = ('brother_ql', 'bs4', 'weasyprint', 'pypdfium2')
+
+# Text template for the get_text_template stage if the label design has none.
+_SAMPLE_TEXT_TEMPLATE = '{{ obj.name }}<br>{{ obj.serial }}<br>{{ obj.site.name }} / {{ obj.rack.name }}'
+
+##################################
+# Stub for a NetBox object (device, rack, etc.). Attributes that are not set are None,
+# like an empty field of a real object.
+class StubObject(SimpleNamespace):
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return None
+
+    def get_absolute_url(self):
+        return f'/dcim/{self.model_name}s/{self.pk}/'
+
+def _stub_object(model_name):
+    site = StubObject(model_name='site', pk=1, name='Site 1', slug='site-1')
+    return StubObject(
+        model_name=model_name,
+        pk=1,
+        id=1,
+        name=f'bench-{model_name}-01',
+        serial='SN0123456789',
+        asset_tag='ASSET-000001',
+        label='A-01',
+        site=site,
+        location=StubObject(model_name='location', pk=1, name='Room 1', site=site),
+        rack=StubObject(model_name='rack', pk=1, name='R01', site=site),
+        tenant=StubObject(model_name='tenant', pk=1, name='Tenant 1'),
+        device_type=StubObject(model='DCS-7050', manufacturer=StubObject(name='Arista')),
+        role=StubObject(name='Leaf'),
+        cf={},
+        custom_field_data={},
+    )
+
+##################################
+# Measures a function.
+# --------------------------------
+# Parameter:
+#   func: Function without parameters
+#   iterations: Number of measured calls
+#   warmup: Number of calls before the measurement (imports, compiled templates, ...)
+# Return:
+#   dict with the times in milliseconds
+def measure(func, iterations, warmup):
+    for _ in range(warmup):
+        func()
+
+    times = []
+    for _ in range(iterations):
+        start = time.perf_counter_ns()
+        func()
+        times.append((time.perf_counter_ns() - start) / 1e6)
+
+    return {
+        'iterations': iterations,
+        'min_ms': round(min(times), 4),
+        'median_ms': round(statistics.median(times), 4),
+        'mean_ms': round(statistics.fmean(times), 4),
+        'max_ms': round(max(times), 4),
+        'stdev_ms': round(statistics.stdev(times), 4) if len(times) > 1 else 0.0,
+    }
+
+
+class Command(BaseCommand):
+    help = 'Measures the stages of the label pipeline (QR code, templates, rendering, printer conversion).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20, help='Measured calls per stage (default: 20)')
+        parser.add_argument('--warmup', type=int, default=2, help='Calls before the measurement (default: 2)')
+        parser.add_argument('--model', default='device', help='Model of the label design (default: device)')
+        parser.add_argument('--label-design', type=int, default=1, help='Label design number (default: 1)')
+        parser.add_argument('--printer-model', default='QL-1060N',
+                            help='Brother model for the conversion (default: QL-1060N, supports all label sizes)')
+        parser.add_argument('--stage', action='append', default=[],
+                            help='Only stages containing this text (can be given several times)')
+        parser.add_argument('--output', help="Write the results as JSON to this file ('-' = stdout)")
+        parser.add_argument('--baseline', help='JSON file of an earlier run to compare with')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Allowed slowdown of the median against the baseline (default: 0.2 = 20%%)')
+        parser.add_argument('--fail-on-regression', action='store_true',
+                            help='Exit with an error if a stage is slower than the baseline allows')
+        parser.add_argument('--importtime', action='store_true',
+                            help='Measure the import time of the plugin at startup (python -X importtime)')
+        parser.add_argument('--import-budget-ms', type=float,
+                            help='Exit with an error if the plugin imports take longer at startup')
+
+    def handle(self, *args, **options):
+        stages = self.get_stages(options)
+        if options['stage']:
+            stages = [(name, func) for name, func in stages if any(s in name for s in options['stage'])]
+
+        results = {}
+        for name, func in stages:
+            try:
+                results[name] = measure(func, options['iterations'], options['warmup'])
+            except ImportError as exc:
+                results[name] = {'skipped': str(exc)}
+            except Exception as exc:
+                results[name] = {'error': f'{type(exc).__name__}: {exc}'}
+            self.write_result(name, results[name])
+
+        if options['importtime']:
+            results['startup_import'] = self.measure_importtime()
+            self.write_importtime(results['startup_import'])
+
+        report = {
+            'meta': {
+                'plugin_version': __version__,
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'model': options['model'],
+                'label_design': options['label_design'],
+                'printer_model': options['printer_model'],
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            },
+            'results': results,
+        }
+
+        if options['output'] == '-':
+            self.stdout.write(json.dumps(report, indent=2))
+        elif options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(report, fh, indent=2)
+
+        if options['baseline']:
+            regressions = self.compare(results, options['baseline'], options['tolerance'])
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f"{len(regressions)} stage(s) slower than the baseline: {', '.join(regressions)}")
+
+        startup = results.get('startup_import')
+        if startup:
+            if startup['heavy_modules']:
+                raise CommandError(f"Imported at startup: {', '.join(startup['heavy_modules'])}")
+            if options['import_budget_ms'] is not None and startup['import_ms'] > options['import_budget_ms']:
+                raise CommandError(
+                    f"Plugin imports take {startup['import_ms']:.1f} ms at startup "
+                    f"(budget {options['import_budget_ms']:.1f} ms)"
+                )
+
+    ##################################
+    # Creates the list of (stage name, function) for the configured label design.
+    def get_stages(self, options):
+        from netbox_qrcode.html_render import _render_html, render_html_to_label_image
+        from netbox_qrcode.label_config import get_label_config
+        from netbox_qrcode.raster_render import can_render_raster, render_label_raster
+        from netbox_qrcode.template_content_functions import config_for_modul, get_text_fields, get_text_template
+        from netbox_qrcode.utilities import get_img_b64, get_qr, get_qr_matrix
+
+        model_name = options['model']
+        label_design_no = options['label_design']
+        config = get_label_config(model_name, label_design_no)
+        if config is None:
+            raise CommandError(f"Label design {label_design_no} is not configured for '{model_name}'.")
+
+        request = RequestFactory().get('/')
+        obj = _stub_object(model_name)
+        plugin = SimpleNamespace(models=[f'dcim.{model_name}'], context={'object': obj, 'request': request})
+
+        qr_args = {k.replace('qr_', ''): v for k, v in config.items() if k.startswith('qr_') and k != 'qr_format'}
+        url = request.build_absolute_uri(obj.get_absolute_url())
+        qr_img = get_qr(url, **qr_args)
+        qr_code = get_img_b64(qr_img)
+        text = get_text_fields(config, obj)
+        template_config = {**config, 'text_template': config.get('text_template') or _SAMPLE_TEXT_TEMPLATE}
+
+        def render_label_template():
+            return render_to_string('netbox_qrcode/qrcode3.html', {
+                **config,
+                'object': obj,
+                'labelDesignNo': label_design_no,
+                'qrCode': qr_code,
+                'text': text,
+            }, request=request)
+
+        stages = [
+            ('get_qr', lambda: get_qr(url, **qr_args)),
+            ('get_img_b64', lambda: get_img_b64(qr_img)),
+            ('config_for_modul', lambda: config_for_modul(plugin, label_design_no)),
+            ('get_text_fields', lambda: get_text_fields(config, obj)),
+            ('get_text_template', lambda: get_text_template(template_config, obj, qr_code)),
+            ('render_qrcode3_html', render_label_template),
+        ]
+
+        try:
+            from netbox_qrcode.printing import _LABEL_SPECS, _get_printer_cfg, extract_label_html
+        except ImportError as exc:
+            # brother_ql / bs4 missing: measure the stages above only
+            self.stderr.write(f'Printing stages skipped: {exc}')
+            return stages
+
+        rendered = render_label_template()
+        html_label = extract_label_html(rendered, f'QR-Code-Label_{label_design_no}')
+
+        _, label_code = _get_printer_cfg()
+        width_px, height_px = self.label_size(_LABEL_SPECS[label_code])
+        width_mm, height_mm = height_px / 300 * 25.4, width_px / 300 * 25.4
+        matrix = get_qr_matrix(url, **qr_args)
+
+        stages += [
+            ('extract_label_html', lambda: extract_label_html(rendered, f'QR-Code-Label_{label_design_no}')),
+            ('render_label_bytes[png]', lambda: _render_html(html_label, width_mm, height_mm)),
+            ('render_label_bytes[pdf]', lambda: _render_html(html_label, width_mm, height_mm, want_pdf=True)),
+            # WeasyPrint PDF and rastering in the label size, as used for printing (not cached)
+            ('render_html_to_label_image', lambda: render_html_to_label_image(
+                html_label, width_mm, height_mm, (width_px, height_px))),
+        ]
+        if can_render_raster(config, text):
+            stages.append(
+                ('render_label_raster', lambda: render_label_raster(config, matrix, text, (height_px, width_px)))
+            )
+
+        for code, spec in _LABEL_SPECS.items():
+            stages += self.get_printer_stages(code, *self.label_size(spec), options['printer_model'])
+
+        return stages
+
+    ##################################
+    # Stages of the printer conversion for one label size of _LABEL_SPECS.
+    def get_printer_stages(self, code, width_px, height_px, printer_model):
+        from PIL import Image
+        from brother_ql import BrotherQLRaster
+        from brother_ql.conversion import convert
+
+        from netbox_qrcode.printing import _convert, _orient_image, _scale_image_to_label
+
+        # Rendered labels are landscape and differ slightly from the label size (rounding of mm),
+        # so scaling and rotating do real work.
+        rendered = Image.new('RGB', (height_px - 1, width_px - 1), 'white')
+
+        def scale_orient():
+            return _orient_image(_scale_image_to_label(rendered, height_px, width_px), width_px, height_px)
+
+        oriented = scale_orient()
+
+        return [
+            (f'scale_orient[{code}]', scale_orient),
+            (f'brother_ql_convert[{code}]', lambda: convert(BrotherQLRaster(printer_model), [oriented], label=code, rotate='0')),
+            # Conversion as used for printing (NumPy preprocessing if installed)
+            (f'raster_convert[{code}]', lambda: _convert(printer_model, [oriented], code)),
+        ]
+
+    ##################################
+    # Starts a new Python process like a NetBox worker (django.setup() and URLs) with
+    # -X importtime and evaluates the imports caused by the plugin.
+    # Return:
+    #   dict with import_ms (cumulative time of the plugin modules), the slowest modules
+    #   and the heavy modules imported by the plugin.
+    def measure_importtime(self):
+        code = 'import django; django.setup(); import netbox_qrcode.urls'
+        process = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            env=os.environ.copy(), capture_output=True, text=True, check=False,
+        )
+        if process.returncode != 0:
+            raise CommandError(f'Import test failed:\n{process.stderr[-2000:]}')
+
+        # Lines: "import time: <self us> | <cumulative us> | <indent><module>", children before parents
+        entries = []
+        for line in process.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _, cumulative, name = line[len('import time:'):].split('|')
+            entries.append((int(cumulative), (len(name) - len(name.lstrip())) // 2, name.strip()))
+
+        plugin_us = 0
+        modules = []
+        heavy = set()
+        stack = [] # Parents of the current entry (in reversed order the parents come first)
+        for cumulative, depth, name in reversed(entries):
+            while stack and stack[-1][0] >= depth:
+                stack.pop()
+            in_plugin = any(parent.startswith('netbox_qrcode') for _, parent in stack)
+
+            if name.startswith('netbox_qrcode'):
+                modules.append((name, cumulative))
+                if not in_plugin:
+                    plugin_us += cumulative
+            elif in_plugin and name.split('.')[0] in _HEAVY_MODULES:
+                heavy.add(name.split('.')[0])
+            stack.append((depth, name))
+
+        modules.sort(key=lambda module: module[1], reverse=True)
+        return {
+            'import_ms': round(plugin_us / 1000, 3),
+            'slowest_modules': [{'module': name, 'cumulative_ms': round(us / 1000, 3)} for name, us in modules[:10]],
+            'heavy_modules': sorted(heavy),
+        }
+
+    def write_importtime(self, result):
+        self.stdout.write('')
+        self.stdout.write(f"{'startup_import':<32} {result['import_ms']:>10.3f} ms")
+        for module in result['slowest_modules']:
+            self.stdout.write(f"  {module['module']:<40} {module['cumulative_ms']:>10.3f} ms")
+        if result['heavy_modules']:
+            self.stdout.write(self.style.ERROR(f"  imported at startup: {', '.join(result['heavy_modules'])}"))
+
+    def label_size(self, spec):
+        return (spec, spec * 4) if isinstance(spec, int) else spec
+
+    def write_result(self, name, result):
+        if 'median_ms' in result:
+            self.stdout.write(
+                f"{name:<32} median {result['median_ms']:>10.3f} ms   min {result['min_ms']:>10.3f} ms   "
+                f"max {result['max_ms']:>10.3f} ms"
+            )
+        else:
+            self.stdout.write(self.style.WARNING(f"{name:<32} {result.get('skipped') or result.get('error')}"))
+
+    ##################################
+    # Compares the medians with an earlier run.
+    # --------------------------------
+    # Parameter:
+    #   results: Results of this run
+    #   baseline_file: JSON file written with --output
+    #   tolerance: Allowed slowdown (0.2 = 20 %)
+    # Return:
+    #   Names of the stages that are slower than allowed.
+    def compare(self, results, baseline_file, tolerance):
+        with open(baseline_file) as fh:
+            baseline = json.load(fh).get('results', {})
+
+        regressions = []
+        self.stdout.write('')
+        self.stdout.write(f'Comparison with {baseline_file} (tolerance {tolerance:.0%}):')
+        for name, result in results.items():
+            before = baseline.get(name, {}).get('median_ms', baseline.get(name, {}).get('import_ms'))
+            now = result.get('median_ms', result.get('import_ms'))
+            if before is None or now is None:
+                continue
+
+            change = (now - before) / before if before else 0.0
+            line = f'{name:<32} {before:>10.3f} ms -> {now:>10.3f} ms  ({change:+.1%})'
+            if change > tolerance:
+                regressions.append(name)
+                self.stdout.write(self.style.ERROR(line))
+            else:
+                self.stdout.write(line)
+
+        return regressions
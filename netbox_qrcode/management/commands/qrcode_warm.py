@@ -0,0 +1,171 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from netbox.plugins.utils import get_plugin_config
+
+# ******************************************************************************************
+# Pre-generates the QR codes (and optionally the PNG previews) of all objects:
+# python manage.py qrcode_warm --base-url https://netbox.example.com
+# The objects are read in chunks and distributed over a process pool. The results are stored
+# in the second cache tier (cache_backend / cache_dir, render_cache_backend / render_cache_dir),
+# which is shared with the NetBox workers.
+# ******************************************************************************************
+
+##################################
+# Initializes a worker process (needed for the 'spawn' start method, a no-op with 'fork').
+def _init_worker():
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+##################################
+# Creates QR codes and previews for one chunk of objects (runs in a worker process).
+# --------------------------------
+# Parameter:
+#   model_name: Model name without app label (e.g. device)
+#   pks: IDs of the objects
+#   base_url: URL of NetBox (host of the QR code URLs, must match the host used by the browsers)
+#   previews: Also render the PNG preview of each label design
+# Return:
+#   (model_name, number of objects, number of QR codes, number of previews, errors)
+def _warm_chunk(model_name, pks, base_url, previews):
+    from django.apps import apps
+    from django.contrib.auth.models import AnonymousUser
+    from django.db import close_old_connections
+    from django.test import RequestFactory
+
+    from netbox_qrcode.export import get_label_file
+    from netbox_qrcode.label_config import get_label_config, get_label_design_numbers
+    from netbox_qrcode.prefetch import prefetch_label_objects
+    from netbox_qrcode.template_content import QRCode
+    from netbox_qrcode.views import create_plugin_instance, get_template_extension
+
+    url = urlsplit(base_url)
+    request = RequestFactory().get('/', HTTP_HOST=url.netloc, secure=(url.scheme == 'https'))
+    request.user = AnonymousUser()
+
+    qr_codes = rendered = 0
+    errors = []
+    try:
+        objs = list(apps.get_model('dcim', model_name).objects.filter(pk__in=pks))
+        extension = get_template_extension(model_name)
+        plugins = [create_plugin_instance(request, extension, obj) for obj in objs]
+
+        for label_design_no in get_label_design_numbers(model_name):
+            prefetch_label_objects(objs, get_label_config(model_name, label_design_no).prefetch_paths)
+
+            for plugin in plugins:
+                try:
+                    if QRCode.Create_LabelData(plugin, label_design_no) is not None:
+                        qr_codes += 1
+                    # Same cache key as the PNG preview (ETag), also for labels drawn without WeasyPrint
+                    if previews and get_label_file(request, plugin, label_design_no, 'png') is not None:
+                        rendered += 1
+                except Exception as exc:
+                    errors.append(f"{model_name} {plugin.context['object'].pk} label {label_design_no}: {exc}")
+    finally:
+        close_old_connections()
+
+    return model_name, len(objs), qr_codes, rendered, errors
+
+
+class Command(BaseCommand):
+    help = 'Pre-generates the QR codes (and optionally PNG previews) of all objects in the shared caches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', required=True,
+                            help='URL of NetBox as used by the browsers, e.g. https://netbox.example.com')
+        parser.add_argument('--models', nargs='+', help='Only these models (default: all with a label design)')
+        parser.add_argument('--previews', action='store_true',
+                            help='Also render the PNG previews')
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                            help='Number of worker processes (default: number of CPUs)')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Objects per work package (default: 500)')
+
+    def handle(self, *args, **options):
+        from django.apps import apps
+        from django.db import connections
+
+        from netbox_qrcode.label_config import MODELS, get_label_design_numbers
+
+        if not urlsplit(options['base_url']).netloc:
+            raise CommandError(f"Invalid --base-url '{options['base_url']}' (e.g. https://netbox.example.com)")
+
+        models = options['models'] or [model for model in MODELS if get_label_design_numbers(model)]
+        unknown = set(models) - set(MODELS)
+        if unknown:
+            raise CommandError(f"Unknown models: {', '.join(sorted(unknown))} (available: {', '.join(MODELS)})")
+
+        if not (get_plugin_config('netbox_qrcode', 'cache_backend') or get_plugin_config('netbox_qrcode', 'cache_dir')):
+            self.stderr.write(self.style.WARNING(
+                'Neither cache_backend nor cache_dir is configured: the generated QR codes are only kept in '
+                'the processes of this command and are not available to NetBox.'
+            ))
+        if options['previews'] and not (
+            get_plugin_config('netbox_qrcode', 'render_cache_backend') or get_plugin_config('netbox_qrcode', 'render_cache_dir')
+        ):
+            self.stderr.write(self.style.WARNING(
+                'Neither render_cache_backend nor render_cache_dir is configured: the rendered previews are only kept '
+                'in the processes of this command and are not available to NetBox.'
+            ))
+
+        # Work packages: IDs in chunks, read with iterator() so that the IDs are not loaded at once
+        chunks = []
+        totals = {}
+        for model_name in models:
+            pks = apps.get_model('dcim', model_name).objects.order_by('pk').values_list('pk', flat=True)
+            chunk = []
+            totals[model_name] = 0
+            for pk in pks.iterator(chunk_size=options['chunk_size']):
+                chunk.append(pk)
+                totals[model_name] += 1
+                if len(chunk) >= options['chunk_size']:
+                    chunks.append((model_name, chunk))
+                    chunk = []
+            if chunk:
+                chunks.append((model_name, chunk))
+
+        total = sum(totals.values())
+        self.stdout.write(f"{total} objects in {len(chunks)} work packages: "
+                          + ', '.join(f'{model} {count}' for model, count in totals.items()))
+        if not total:
+            return
+
+        # The worker processes must not share the database connections of this process.
+        connections.close_all()
+
+        start = time.monotonic()
+        done = qr_codes = rendered = 0
+        errors = []
+        with ProcessPoolExecutor(max_workers=options['processes'], initializer=_init_worker) as executor:
+            futures = [
+                executor.submit(_warm_chunk, model_name, pks, options['base_url'], options['previews'])
+                for model_name, pks in chunks
+            ]
+            for future in as_completed(futures):
+                model_name, count, chunk_qr, chunk_rendered, chunk_errors = future.result()
+                done += count
+                qr_codes += chunk_qr
+                rendered += chunk_rendered
+                errors += chunk_errors
+
+                elapsed = time.monotonic() - start or 1e-9
+                self.stdout.write(
+                    f'{done}/{total} objects ({done / total:.0%}), {done / elapsed:.0f} objects/s, '
+                    f'last: {model_name}'
+                )
+
+        for error in errors[:20]:
+            self.stderr.write(self.style.ERROR(error))
+
+        elapsed = time.monotonic() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'{done} objects, {qr_codes} QR codes, {rendered} previews in {elapsed:.1f} s '
+            f'({done / elapsed if elapsed else 0:.0f} objects/s, {options["processes"]} processes), '
+            f'{len(errors)} errors'
+        ))
@@ -0,0 +1,155 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.dispatch import Signal
+from netbox.plugins.utils import get_plugin_config
+
+logger = logging.getLogger('netbox_qrcode.metrics')
+
+# ******************************************************************************************
+# Timings and counters of the label pipeline.
+# Every stage (QR code, template, WeasyPrint, pdfium, scaling, printer, ...) is measured
+# with span(), events (renders, cache hits, print failures, bytes sent) are counted with
+# increment(). The values are
+#   - kept per process (snapshot()),
+#   - sent as Django signals (stage_timed, counter_incremented),
+#   - logged on the logger 'netbox_qrcode.metrics' (DEBUG),
+#   - exported to prometheus_client if installed ('metrics_prometheus'), e.g. for the
+#     /metrics endpoint of NetBox (METRICS_ENABLED).
+# ******************************************************************************************
+
+# Sent after each measured stage: stage (name), duration (seconds), labels (dict)
+stage_timed = Signal()
+
+# Sent for each counted event: name, value, labels (dict)
+counter_incremented = Signal()
+
+# Histogram buckets (seconds) for the Prometheus export
+_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_lock = threading.Lock()
+_timings = {} # (stage, labels) -> {'count', 'total', 'max'}
+_counters = {} # (name, labels) -> value
+_prometheus = {} # metric name -> prometheus_client metric (None = not available)
+
+def _enabled():
+    return get_plugin_config('netbox_qrcode', 'metrics', True)
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+##################################
+# Returns the Prometheus metric for a stage/counter or None if prometheus_client is not used.
+# The label names are fixed on first use of the metric.
+def _get_prometheus_metric(kind, name, labels):
+    metric_name = f'netbox_qrcode_{name}_seconds' if kind == 'histogram' else f'netbox_qrcode_{name}_total'
+    with _lock:
+        if metric_name in _prometheus:
+            return _prometheus[metric_name]
+
+        metric = None
+        if get_plugin_config('netbox_qrcode', 'metrics_prometheus', True):
+            try:
+                import prometheus_client
+            except ImportError:
+                pass
+            else:
+                if kind == 'histogram':
+                    metric = prometheus_client.Histogram(
+                        metric_name, f'Duration of the label stage {name}', sorted(labels), buckets=_BUCKETS
+                    )
+                else:
+                    metric = prometheus_client.Counter(metric_name, f'Label pipeline counter {name}', sorted(labels))
+        _prometheus[metric_name] = metric
+        return metric
+
+def _export(kind, name, labels, value):
+    metric = _get_prometheus_metric(kind, name, labels)
+    if metric is None:
+        return
+    try:
+        target = metric.labels(**labels) if labels else metric
+        if kind == 'histogram':
+            target.observe(value)
+        else:
+            target.inc(value)
+    except ValueError:
+        # Different label names than on first use
+        logger.debug('netbox_qrcode: labels %s do not match the Prometheus metric %s', sorted(labels), name)
+
+##################################
+# Records the duration of a stage.
+# --------------------------------
+# Parameter:
+#   stage: Name of the stage (e.g. 'qr_code', 'weasyprint_layout', 'printer_write')
+#   duration: Duration in seconds
+#   **labels: Additional dimensions (e.g. kind='png', printer='office')
+def observe(stage, duration, **labels):
+    with _lock:
+        entry = _timings.setdefault((stage, _label_key(labels)), {'count': 0, 'total': 0.0, 'max': 0.0})
+        entry['count'] += 1
+        entry['total'] += duration
+        entry['max'] = max(entry['max'], duration)
+
+    logger.debug('netbox_qrcode: %s %.1f ms %s', stage, duration * 1000, labels or '')
+    stage_timed.send(sender='netbox_qrcode', stage=stage, duration=duration, labels=labels)
+    _export('histogram', stage, labels, duration)
+
+##################################
+# Measures the duration of the enclosed block as stage (see observe()).
+@contextmanager
+def span(stage, **labels):
+    if not _enabled():
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start, **labels)
+
+##################################
+# Counts an event.
+# --------------------------------
+# Parameter:
+#   name: Name of the counter (e.g. 'renders', 'cache_hits', 'print_failures', 'printer_bytes')
+#   value: Amount to add
+#   **labels: Additional dimensions (e.g. printer='office')
+def increment(name, value=1, **labels):
+    if not _enabled():
+        return
+
+    with _lock:
+        key = (name, _label_key(labels))
+        _counters[key] = _counters.get(key, 0) + value
+
+    counter_incremented.send(sender='netbox_qrcode', name=name, value=value, labels=labels)
+    _export('counter', name, labels, value)
+
+##################################
+# Returns the timings and counters of this process.
+def snapshot():
+    with _lock:
+        return {
+            'timings': [
+                {
+                    'stage': stage, 'labels': dict(labels), 'count': entry['count'],
+                    'total_ms': round(entry['total'] * 1000, 3),
+                    'mean_ms': round(entry['total'] * 1000 / entry['count'], 3),
+                    'max_ms': round(entry['max'] * 1000, 3),
+                }
+                for (stage, labels), entry in _timings.items()
+            ],
+            'counters': [
+                {'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in _counters.items()
+            ],
+        }
+
+def reset():
+    with _lock:
+        _timings.clear()
+        _counters.clear()
@@ -0,0 +1,103 @@
+import re
+from collections import defaultdict
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Model, prefetch_related_objects
+
+# ******************************************************************************************
+# Loads the related objects required for the label text in batched queries.
+# The relation paths are derived from 'text_fields' and the user templates, e.g.
+# 'a_terminations.device' of a cable loads all terminations and then all their devices
+# with one query per level instead of one query per object.
+# ******************************************************************************************
+
+# Properties that are based on a relation (model, property) -> prefetch lookup
+_ALIASES = {
+    ('dcim.cable', 'a_terminations'): 'terminations__termination',
+    ('dcim.cable', 'b_terminations'): 'terminations__termination',
+}
+
+# {{ obj.a.b.c }} in 'url_template' / 'text_template'
+_TEMPLATE_PATH_RE = re.compile(r'\bobj((?:\.\w+)+)')
+
+##################################
+# Derives the relation paths of a label configuration.
+# --------------------------------
+# Parameter:
+#   text_fields: Entries of 'text_fields' (e.g. ['name', 'a_terminations.device'])
+#   templates: Template strings ('url_template', 'text_template'), None is ignored
+# Return:
+#   Tuple of paths as tuples of hops, e.g. (('a_terminations', 'device'),)
+def get_prefetch_paths(text_fields, templates=()):
+    paths = set()
+
+    for spec in text_fields:
+        paths.add(tuple(spec.split('.')))
+
+    for source in templates:
+        for match in _TEMPLATE_PATH_RE.finditer(source or ''):
+            paths.add(tuple(match.group(1).lstrip('.').split('.')))
+
+    # Single field names without relation to other objects do not need any prefetching.
+    return tuple(sorted(path for path in paths if len(path) >= 2 or path[0] in {attr for (_, attr) in _ALIASES}))
+
+##################################
+# Returns the objects that a hop leads to (object, list or related manager).
+def _follow(obj, hop):
+    value = getattr(obj, hop, None)
+    if value is None:
+        return []
+    if isinstance(value, Model):
+        return [value]
+    if isinstance(value, (list, tuple)):
+        return [item for item in value if isinstance(item, Model)]
+    if callable(getattr(value, 'all', None)):
+        return list(value.all()) # Uses the prefetched results
+    return []
+
+##################################
+# Checks whether a hop is a relation of the model that can be prefetched.
+def _lookup(model, hop):
+    alias = _ALIASES.get((model._meta.label_lower, hop))
+    if alias:
+        return alias
+    try:
+        field = model._meta.get_field(hop)
+    except FieldDoesNotExist:
+        return None
+    return hop if field.is_relation else None
+
+##################################
+# Loads all related objects of the relation paths for one or more objects.
+# Objects of each level are grouped by model, so mixed termination types
+# (interfaces, front ports, power feeds etc.) are loaded with one query per type.
+# Relations that are already loaded are not queried again.
+# --------------------------------
+# Parameter:
+#   obj: Data from the model (e.g. device, rack, etc.) or a list of such objects (e.g. bulk printing)
+#   paths: Relation paths from get_prefetch_paths()
+def prefetch_label_objects(obj, paths):
+    objs = list(obj) if isinstance(obj, (list, tuple)) else [obj]
+    if not objs:
+        return
+
+    for path in paths:
+        level = objs
+
+        for hop in path:
+            by_model = defaultdict(list)
+            for item in level:
+                by_model[type(item)].append(item)
+
+            next_level = []
+            for model, items in by_model.items():
+                lookup = _lookup(model, hop)
+                if lookup is None:
+                    continue
+                prefetch_related_objects(items, lookup)
+                for item in items:
+                    next_level.extend(_follow(item, hop))
+
+            if not next_level:
+                break
+            level = next_level
@@ -0,0 +1,291 @@
+import itertools
+import logging
+import select
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List
+
+from netbox.plugins.utils import get_plugin_config
+
+from .metrics import increment, span
+
+logger = logging.getLogger("netbox_qrcode")
+
+# ---------------------------------------------------------------------------
+# Drucker-Pools: Auswahl, Lastverteilung, Health-Check und Failover
+#
+# Ein Label-Design wählt über 'printer' einen Drucker aus PRINTERS oder einen
+# Pool aus PRINTER_POOLS (ohne Angabe: DEFAULT_PRINTER).  Aus dem Pool kommen
+# nur Drucker in Frage, deren Medien ('LABELS') zum Labelcode passen.  Die
+# Reihenfolge bestimmt 'printer_dispatch' (round_robin / least_busy); fällt
+# ein Drucker beim Schreiben aus, wird er für 'printer_retry_interval'
+# Sekunden übersprungen und der Auftrag geht an den nächsten Drucker.
+# ---------------------------------------------------------------------------
+
+_lock = threading.Lock()
+_in_flight: Dict[str, int] = {}  # laufende Aufträge je Drucker (dieser Prozess)
+_down_until: Dict[str, float] = {}  # Drucker → Zeitpunkt des nächsten Versuchs
+_round_robin: Dict[tuple, Iterator[int]] = {}
+
+
+class NoPrinterAvailable(RuntimeError):
+    """Kein Drucker des Pools ist erreichbar oder hat die passenden Medien."""
+
+
+class PrinterBusy(RuntimeError):
+    """Der Drucker hat innerhalb von 'printer_queue_timeout' keinen Platz frei."""
+
+
+def get_printers() -> Dict[str, Dict[str, Any]]:
+    return get_plugin_config("netbox_qrcode", "PRINTERS", {}) or {}
+
+
+def resolve_printer_names(selection: str | list | None = None) -> List[str]:
+    """
+    Löst die Druckerauswahl eines Label-Designs in Druckernamen auf.
+    selection: Name eines Druckers, Name eines Pools, Liste von beidem
+    oder None (DEFAULT_PRINTER, sonst der erste Drucker).
+    """
+    printers = get_printers()
+    pools = get_plugin_config("netbox_qrcode", "PRINTER_POOLS", {}) or {}
+
+    if selection is None:
+        selection = get_plugin_config("netbox_qrcode", "DEFAULT_PRINTER", next(iter(printers), None))
+
+    names: List[str] = []
+    for entry in selection if isinstance(selection, (list, tuple)) else [selection]:
+        for name in pools.get(entry, [entry]):
+            if name in printers and name not in names:
+                names.append(name)
+            elif name not in printers:
+                logger.warning("netbox_qrcode: printer '%s' is not configured in PRINTERS.", name)
+    return names
+
+
+def _supports(p_cfg: Dict[str, Any], label_code: str) -> bool:
+    labels = p_cfg.get("LABELS")
+    return not labels or label_code in labels
+
+
+def _is_healthy(name: str, p_cfg: Dict[str, Any]) -> bool:
+    """
+    Ein als ausgefallen markierter Drucker wird erst nach Ablauf der Wartezeit
+    erneut geprüft (TCP-Verbindungsaufbau mit Timeout, nur Netzwerkdrucker).
+    """
+    with _lock:
+        down_until = _down_until.get(name)
+    if down_until is None:
+        return True
+    if down_until > time.monotonic():
+        return False
+
+    if probe_printer(p_cfg):
+        with _lock:
+            _down_until.pop(name, None)
+        logger.info("netbox_qrcode: printer '%s' is reachable again.", name)
+        return True
+
+    mark_printer_down(name)
+    return False
+
+
+def probe_printer(p_cfg: Dict[str, Any]) -> bool:
+    """Prüft, ob ein Netzwerkdrucker eine Verbindung annimmt."""
+    if p_cfg.get("BACKEND") != "network":
+        return True  # USB/Datei: kein sinnvoller Test ohne Schreiben
+
+    address = str(p_cfg.get("ADDRESS", ""))
+    host, _, port = address.removeprefix("tcp://").partition(":")
+    timeout = get_plugin_config("netbox_qrcode", "printer_timeout", 5)
+    try:
+        with socket.create_connection((host, int(port or 9100)), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+def mark_printer_down(name: str) -> None:
+    interval = get_plugin_config("netbox_qrcode", "printer_retry_interval", 30)
+    with _lock:
+        _down_until[name] = time.monotonic() + interval
+
+
+def select_printers(label_code: str, selection: str | list | None = None) -> List[str]:
+    """
+    Liefert die passenden, erreichbaren Drucker in der Reihenfolge, in der sie
+    versucht werden sollen (erster Eintrag = bevorzugter Drucker).
+    """
+    printers = get_printers()
+    names = [name for name in resolve_printer_names(selection) if _supports(printers[name], label_code)]
+    if not names:
+        raise NoPrinterAvailable(f"Kein Drucker für Label {label_code} konfiguriert.")
+
+    dispatch = get_plugin_config("netbox_qrcode", "printer_dispatch", "round_robin")
+    with _lock:
+        if dispatch == "least_busy":
+            # Stabil sortiert: bei Gleichstand bleibt die konfigurierte Reihenfolge
+            names.sort(key=lambda name: _in_flight.get(name, 0))
+        else:
+            counter = _round_robin.setdefault(tuple(names), itertools.count())
+            start = next(counter) % len(names)
+            names = names[start:] + names[:start]
+
+    return [name for name in names if _is_healthy(name, printers[name])]
+
+
+@contextmanager
+def printer_slot(name: str):
+    """Zählt einen laufenden Auftrag für 'least_busy'."""
+    with _lock:
+        _in_flight[name] = _in_flight.get(name, 0) + 1
+    try:
+        yield
+    finally:
+        with _lock:
+            _in_flight[name] -= 1
+
+
+# ---------------------------------------------------------------------------
+# Verbindungen je Drucker: höchstens 'printer_max_jobs' gleichzeitige Aufträge,
+# weitere warten bis 'printer_queue_timeout' (sonst PrinterBusy).  Netzwerk-
+# drucker (TCP 9100) behalten ihre Verbindung 'printer_keepalive' Sekunden
+# für den nächsten Auftrag; andere Backends laufen über brother_ql.
+# Alle Grenzen gelten je Prozess: eine offen gehaltene Verbindung eines
+# Prozesses blockiert Drucker, die nur eine Verbindung annehmen, für alle
+# anderen Prozesse – daher ist 'printer_keepalive' standardmäßig 0.
+# ---------------------------------------------------------------------------
+
+class _SocketConnection:
+    """Wiederverwendbare TCP-Verbindung zu einem Netzwerkdrucker."""
+
+    def __init__(self, address: str):
+        host, _, port = str(address).removeprefix("tcp://").partition(":")
+        self.host, self.port = host, int(port or 9100)
+        self.sock: socket.socket | None = None
+        self.last_used = 0.0
+
+    def _is_stale(self, keepalive: float) -> bool:
+        if time.monotonic() - self.last_used > keepalive:
+            return True
+        # Vom Drucker geschlossen? (lesbar, aber keine Daten)
+        readable, _, _ = select.select([self.sock], [], [], 0)
+        if not readable:
+            return False
+        try:
+            return self.sock.recv(1, socket.MSG_PEEK) == b""
+        except OSError:
+            return True
+
+    def write(self, data: bytes, connect_timeout: float, write_timeout: float, keepalive: float) -> None:
+        if self.sock is not None and self._is_stale(keepalive):
+            self.close()
+        if self.sock is None:
+            self.sock = socket.create_connection((self.host, self.port), timeout=connect_timeout)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        try:
+            self.sock.settimeout(write_timeout)
+            self.sock.sendall(data)
+        except OSError:
+            self.close()
+            raise
+
+        self.last_used = time.monotonic()
+        if not keepalive:
+            self.close()
+
+    def close(self) -> None:
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            finally:
+                self.sock = None
+
+
+class _PrinterChannel:
+    """Begrenzt die gleichzeitigen Aufträge eines Druckers und hält freie Verbindungen."""
+
+    def __init__(self, max_jobs: int):
+        self.slots = threading.BoundedSemaphore(max_jobs)
+        self.idle: List[_SocketConnection] = []
+        self.lock = threading.Lock()
+
+
+_channels: Dict[str, _PrinterChannel] = {}
+
+
+def _get_channel(name: str, p_cfg: Dict[str, Any]) -> _PrinterChannel:
+    with _lock:
+        channel = _channels.get(name)
+        if channel is None:
+            max_jobs = p_cfg.get("MAX_JOBS") or get_plugin_config("netbox_qrcode", "printer_max_jobs", 1)
+            channel = _channels[name] = _PrinterChannel(max_jobs)
+    return channel
+
+
+def write_to_printer(name: str, p_cfg: Dict[str, Any], data: bytes) -> None:
+    """Schickt fertige Druckdaten an einen Drucker (mit Warteschlange und Timeouts)."""
+    channel = _get_channel(name, p_cfg)
+    queue_timeout = get_plugin_config("netbox_qrcode", "printer_queue_timeout", 60)
+    if not channel.slots.acquire(timeout=queue_timeout):
+        raise PrinterBusy(f"Drucker '{name}' ist ausgelastet.")
+
+    try:
+        with span("printer_write", printer=name):
+            _write(channel, p_cfg, data)
+        increment("printer_bytes", len(data), printer=name)
+    finally:
+        channel.slots.release()
+
+
+def _write(channel: _PrinterChannel, p_cfg: Dict[str, Any], data: bytes) -> None:
+    if p_cfg.get("BACKEND") != "network":
+        from brother_ql.backends import backend_factory
+
+        backend_factory(p_cfg["BACKEND"])["backend_class"](p_cfg["ADDRESS"]).write(data)
+        return
+
+    with channel.lock:
+        connection = channel.idle.pop() if channel.idle else _SocketConnection(p_cfg["ADDRESS"])
+    connection.write(
+        data,
+        connect_timeout=get_plugin_config("netbox_qrcode", "printer_timeout", 5),
+        write_timeout=get_plugin_config("netbox_qrcode", "printer_write_timeout", 30),
+        keepalive=get_plugin_config("netbox_qrcode", "printer_keepalive", 0),
+    )
+    if connection.sock is not None:
+        with channel.lock:
+            channel.idle.append(connection)
+
+
+def send_with_failover(label_code: str, selection: str | list | None, send) -> str:
+    """
+    Schickt einen Auftrag an den ersten funktionierenden Drucker.
+    send(name, p_cfg) erzeugt die Druckdaten für das Druckermodell und schreibt
+    sie; bei einem Fehler wird der Drucker als ausgefallen markiert und der
+    nächste versucht.  Rückgabe: Name des Druckers, der gedruckt hat.
+    """
+    printers = get_printers()
+    names = select_printers(label_code, selection)
+    if not names:
+        raise NoPrinterAvailable(f"Kein Drucker für Label {label_code} erreichbar.")
+
+    last_error = None
+    for name in names:
+        try:
+            with printer_slot(name):
+                send(name, printers[name])
+            increment("print_jobs", printer=name)
+            return name
+        except PrinterBusy as exc:
+            last_error = exc
+            logger.info("netbox_qrcode: printer '%s' is busy, trying next printer.", name)
+        except OSError as exc:
+            last_error = exc
+            increment("print_failures", printer=name)
+            mark_printer_down(name)
+            logger.warning("netbox_qrcode: printer '%s' failed (%s), trying next printer.", name, exc)
+
+    raise NoPrinterAvailable(f"Kein Drucker für Label {label_code} erreichbar: {last_error}") from last_error
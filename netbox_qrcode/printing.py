@@ -1,14 +1,12 @@
-from io import BytesIO
-from typing import Dict, Any, Tuple
+import math
+from typing import Any, Callable, Dict, Tuple
 
 from netbox.plugins.utils import get_plugin_config
-from brother_ql import BrotherQLRaster
-from brother_ql.conversion import convert
-from brother_ql.backends import backend_factory
-from PIL import Image
-from bs4 import BeautifulSoup
+from PIL import Image, ImageChops
 
-from .html_render import render_html_to_png
+from .cache import make_key, raster_cache
+from .metrics import span
+from .printers import send_with_failover, write_to_printer
 
 # ---------------------------------------------------------------------------
 # Pixel‑Maße bei 300 dpi – Keys entsprechen Brother‑Labelcodes
@@ -18,7 +16,7 @@ _LABEL_SPECS: dict[str, int | tuple[int, int]] = {
     "17x54": (165, 566), "17x87": (165, 956), "23x23": (202, 202),
     "29x42": (306, 425), "29x90": (306, 991), "39x90": (413, 991),
     "39x48": (425, 495), "52x29": (578, 271), "62x29": (696, 271),
-    "62x100": (696, 1109), "102x51": (1164, 526), "102x152": (1164, 1660),
+    "62x100": (696, 1109), "62red": 696, "102x51": (1164, 526), "102x152": (1164, 1660),
     "d12": (94, 94), "d24": (236, 236), "d58": (618, 618),
 }
 
@@ -54,9 +52,12 @@ def _scale_image_to_label(img: Image.Image, width_px: int, height_px: int) -> Im
     # *Innen*-Fit: größte Vergrößerung, bei der beide Seiten ≤ Zielmaß bleiben
     scale = min(width_px / img.width, height_px / img.height)
     new_size = (round(img.width * scale), round(img.height * scale))
+    if img.mode == "1":
+        img = img.convert("L")  # LANCZOS braucht Graustufen
     img = img.resize(new_size, Image.LANCZOS)
 
-    bg = Image.new("RGB", (width_px, height_px), "white")
+    # Graustufen bleiben Graustufen (brother_ql wandelt ohnehin nach "L")
+    bg = Image.new("L" if img.mode == "L" else "RGB", (width_px, height_px), "white")
     offset = ((width_px - new_size[0]) // 2, (height_px - new_size[1]) // 2)
     bg.paste(img, offset)
     return bg
@@ -72,46 +73,330 @@ def _orient_image(img: Image.Image, width_px: int, height_px: int) -> Image.Imag
     if img.size == (width_px, height_px):
         return img
     if img.size == (height_px, width_px):
-        # clockwise 90° → Pillow: -90 °
-        return img.rotate(-90, expand=True)
+        # clockwise 90° – verlustfreie Transposition statt rotate(-90, expand=True)
+        return img.transpose(Image.Transpose.ROTATE_270)
 
     # Sonderfall: zunächst korrekt einpassen, dann Rekursion
     img = _scale_image_to_label(img, height_px, width_px)
     return _orient_image(img, width_px, height_px)
 
 # ---------------------------------------------------------------------------
-# Hauptfunktion: HTML → Brother-QL-Druck
+# Raster-Vorverarbeitung mit NumPy (optional): Schwellwert/Dithering und
+# Rot/Schwarz-Trennung vektorisiert, danach direkt als 1-Bit-Zeilen in der
+# Druckerbreite an den Rastergenerator von brother_ql.  Ohne NumPy übernimmt
+# brother_ql.conversion.convert die Umwandlung wie bisher.
+# ---------------------------------------------------------------------------
+
+def is_red_label(label_code: str) -> bool:
+    """Zweifarbiges Band (Schwarz/Rot, z. B. DK-22251 = "62red")?"""
+    return label_code.endswith("red")
+
+
+def _threshold_value(threshold_pct: float) -> int:
+    # Wie brother_ql: 70 % → Punkte ab 30 % Schwärzung werden gedruckt
+    return min(255, max(0, int((100.0 - threshold_pct) / 100.0 * 255)))
+
+
+def _bayer_levels(size: int = 8) -> list[list[int]]:
+    """Bayer-Matrix size × size mit den Stufen 0 … size² - 1."""
+    matrix = [[0]]
+    while len(matrix) < size:
+        top = [[4 * v for v in row] + [4 * v + 2 for v in row] for row in matrix]
+        bottom = [[4 * v + 3 for v in row] + [4 * v + 1 for v in row] for row in matrix]
+        matrix = top + bottom
+    return matrix
+
+
+def _bayer_matrix(size: int = 8):
+    import numpy as np
+
+    matrix = np.array(_bayer_levels(size))
+    return (matrix + 0.5) * 256 / matrix.size  # Schwellen 0…255
+
+
+def _ordered_dither(img: Image.Image) -> Image.Image:
+    """
+    Geordnetes Dithering nur mit Pillow (ohne NumPy), Ergebnis wie _ink_mask:
+    Punkt drucken, wenn 255 - Grauwert > Bayer-Schwelle.  Liefert ein 1-Bit-Bild
+    (0 = drucken), das brother_ql ohne eigenes Dithering unverändert übernimmt.
+    """
+    levels = _bayer_levels()
+    size = len(levels)
+    tile = Image.new("L", (size, size))
+    # Grauwert < 255 - Schwelle → drucken; als Ganzzahl aufgerundet
+    tile.putdata([math.ceil(255 - (v + 0.5) * 256 / size ** 2) for row in levels for v in row])
+
+    limits = Image.new("L", img.size)
+    for y in range(0, img.height, size):
+        for x in range(0, img.width, size):
+            limits.paste(tile, (x, y))
+
+    return ImageChops.subtract(limits, img.convert("L")).point(lambda v: 0 if v else 255, "1")
+
+
+def _ink_mask(img: Image.Image, threshold: int, dither: str):
+    """Graustufenbild → bool-Array (True = Punkt drucken)."""
+    import numpy as np
+
+    if dither == "floyd_steinberg":
+        # Fehlerdiffusion ist sequentiell – Pillows C-Implementierung nutzen (invertiert wie brother_ql)
+        inverted = Image.eval(img.convert("L"), lambda x: 255 - x)
+        return np.asarray(inverted.convert("1", dither=Image.Dither.FLOYDSTEINBERG))
+
+    ink = 255 - np.asarray(img.convert("L"), dtype=np.int16)
+    if dither == "ordered":
+        height, width = ink.shape
+        bayer = _bayer_matrix()
+        tiles = np.tile(bayer, (height // bayer.shape[0] + 1, width // bayer.shape[1] + 1))
+        return ink > tiles[:height, :width]
+    return ink >= threshold
+
+
+def _red_black_masks(img: Image.Image, threshold: int):
+    """RGB-Bild → (schwarz, rot) als bool-Arrays, Filter wie brother_ql (HSV)."""
+    import numpy as np
+
+    rgb = img.convert("RGB")
+    hsv = np.asarray(rgb.convert("HSV"))
+    hue, sat, val = hsv[..., 0], hsv[..., 1], hsv[..., 2]
+    dark = (255 - np.asarray(rgb.convert("L"), dtype=np.int16)) >= threshold
+
+    red = ((hue < 40) | (hue > 210)) & (sat > 100) & (val > 80) & dark
+    black = (val < 80) & dark & ~red
+    return black, red
+
+
+def _pack_rows(mask, device_width: int, offset: int):
+    """
+    Legt die Maske in die volle Druckerbreite und packt sie zeilenweise in
+    Bits – gespiegelt, wie der Drucker die Zeilen erwartet.  Ergebnis: uint8-
+    Array (Zeilen × Bytes je Zeile).
+    """
+    import numpy as np
+
+    height, width = mask.shape
+    canvas = np.zeros((height, device_width), dtype=bool)
+    canvas[:, offset:offset + width] = mask
+    return np.packbits(canvas[:, ::-1], axis=1)
+
+
+def _add_raster_rows(qlr, planes) -> None:
+    """
+    Schreibt die Rasterzeilen direkt (ohne brother_ql add_raster_data, das
+    jede Zeile in Python zusammensetzt): je Zeile 0x67 0x00 (einfarbig) bzw.
+    0x77 0x01/0x02 (schwarz/rot), Länge, Daten.
+    """
+    import numpy as np
+
+    height, row_len = planes[0].shape
+    if len(planes) == 1:
+        headers = [(0x67, 0x00, row_len)]
+    else:
+        headers = [(0x77, 0x01, row_len), (0x77, 0x02, row_len)]
+
+    parts = []
+    for header, rows in zip(headers, planes):
+        parts += [np.tile(np.array(header, dtype=np.uint8), (height, 1)), rows]
+    qlr.data += np.hstack(parts).tobytes()
+
+
+def _add_preamble(qlr) -> None:
+    """Auftragsbeginn wie in brother_ql: Modus, Invalidate, Initialize, Modus."""
+    from brother_ql import BrotherQLUnsupportedCmd
+
+    def switch_mode():
+        try:
+            qlr.add_switch_mode()
+        except BrotherQLUnsupportedCmd:
+            pass
+
+    switch_mode()
+    qlr.add_invalidate()
+    qlr.add_initialize()
+    switch_mode()
+
+
+def _convert_numpy(qlr, images: list[Image.Image], label: str, red: bool = False, dither: str = "threshold",
+                   threshold: float = 70, cut: bool = True) -> bytes:
+    """
+    Entspricht brother_ql.conversion.convert(..., rotate="0") für Bilder, die
+    bereits in Druckgröße und Hochformat vorliegen (siehe print_labels).
+    """
+    from brother_ql import BrotherQLUnsupportedCmd
+    from brother_ql.conversion import DIE_CUT_LABEL, ROUND_DIE_CUT_LABEL, label_type_specs, right_margin_addition
+
+    specs = label_type_specs[label]
+    die_cut = specs["kind"] in (DIE_CUT_LABEL, ROUND_DIE_CUT_LABEL)
+    dots_printable = specs["dots_printable"]
+    device_width = qlr.get_pixel_width()
+    offset = device_width - dots_printable[0] - specs["right_margin_dots"] - right_margin_addition.get(qlr.model, 0)
+    threshold = _threshold_value(threshold)
+
+    if red and not qlr.two_color_support:
+        raise BrotherQLUnsupportedCmd("Printing in red is not supported with the selected model.")
+
+    _add_preamble(qlr)
+
+    for img in images:
+        if img.width != dots_printable[0] or (die_cut and img.height != dots_printable[1]):
+            raise ValueError(f"Bad image dimensions: {img.size}. Expecting: {dots_printable}.")
+
+        masks = _red_black_masks(img, threshold) if red else [_ink_mask(img, threshold, dither)]
+        planes = [_pack_rows(mask, device_width, offset) for mask in masks]
+
+        qlr.add_status_information()
+        qlr.mtype = 0x0B if die_cut else 0x0A
+        qlr.mwidth = specs["tape_size"][0]
+        qlr.mlength = specs["tape_size"][1] if die_cut else 0
+        qlr.pquality = 1
+        qlr.add_media_and_quality(img.height)
+        try:
+            if cut:
+                qlr.add_autocut(True)
+                qlr.add_cut_every(1)
+        except BrotherQLUnsupportedCmd:
+            pass
+        try:
+            qlr.dpi_600 = False
+            qlr.cut_at_end = cut
+            qlr.two_color_printing = red
+            qlr.add_expanded_mode()
+        except BrotherQLUnsupportedCmd:
+            pass
+        qlr.add_margins(specs["feed_margin"])
+        _add_raster_rows(qlr, planes)
+        qlr.add_print()
+
+    return qlr.data
+
+
+def _convert(model: str, images: list[Image.Image], label: str) -> bytes:
+    """Bilder → Brother-Rasterbefehle (mit NumPy vektorisiert, sonst brother_ql)."""
+    from brother_ql import BrotherQLRaster  # erst beim ersten Druck laden
+
+    dither = get_plugin_config("netbox_qrcode", "print_dither", "threshold")
+    threshold = get_plugin_config("netbox_qrcode", "print_threshold", 70)
+    red = is_red_label(label)
+
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        from brother_ql.conversion import convert
+
+        # brother_ql kennt nur Floyd-Steinberg, geordnetes Dithering vorher selbst (nicht für Rot)
+        if dither == "ordered" and not red:
+            images = [_ordered_dither(img) for img in images]
+        return convert(BrotherQLRaster(model), images, label=label, rotate="0", red=red,
+                       dither=(dither == "floyd_steinberg"), threshold=threshold)
+
+    return _convert_numpy(BrotherQLRaster(model), images, label, red=red, dither=dither, threshold=threshold)
+
+
+def _preamble(model: str) -> bytes:
+    from brother_ql import BrotherQLRaster
+
+    qlr = BrotherQLRaster(model)
+    _add_preamble(qlr)
+    return qlr.data
+
+
+def _convert_page(model: str, img: Image.Image, label: str) -> bytes:
+    """
+    Rasterbefehle *einer* Seite ohne Auftragsbeginn.  Jede Seite endet mit
+    eigenem Druckbefehl, daher ergibt Auftragsbeginn + beliebige Seiten einen
+    gültigen Auftrag (siehe print_labels).
+    """
+    data = _convert(model, [img], label)
+    preamble = _preamble(model)
+    if not data.startswith(preamble):
+        raise RuntimeError(f"Unerwarteter Auftragsbeginn für {model}.")
+    return data[len(preamble):]
+
+# ---------------------------------------------------------------------------
+# Hauptfunktion: Label-Bilder → Brother-QL-Druck (siehe jobs.run_print_job)
 # ---------------------------------------------------------------------------
 
-def print_label_from_html(html: str, label_code: str | None = None) -> None:
-    """Rendert HTML, skaliert es passend und schickt es an den Brother-Drucker."""
+def print_labels(labels: list[tuple[str | None, Callable[[], Image.Image | None]]],
+                 label_code: str | None = None, printer: str | list | None = None) -> str:
+    """
+    Druckt mehrere Labels als *einen* Auftrag mit einer einzigen Verbindung
+    zum Drucker (Sammeldruck), mit Cache der fertigen Druckdaten je Seite.
+    labels: Liste aus (Schlüssel, Erzeuger).  Der Schlüssel beschreibt den
+    Label-Inhalt (Objekt, Version, Design, Host; None = nicht cachen), der
+    Erzeuger liefert das Label-Bild und wird nur aufgerufen, wenn die Seite
+    für Druckermodell und Labelcode noch nicht im raster_cache liegt – ein
+    Nachdruck ist dann nur noch das Schreiben an den Drucker.
+    printer: Drucker oder Pool des Label-Designs (None = DEFAULT_PRINTER).
+    Rückgabe: Name des Druckers, der den Auftrag gedruckt hat.
+    """
+
+    _, default_label = _get_printer_cfg()
+    code = label_code or default_label
+
+    # 5) In Brother-Raster wandeln (einmal je Druckermodell, Seiten aus dem
+    #    Cache) und senden, bei einem Ausfall an den nächsten Drucker des Pools
+    instructions: dict[str, bytes] = {}
+    prepared: dict[int, Image.Image | None] = {}  # Bilder nur einmal je Auftrag erzeugen
 
-    # 1) Drucker-/Label-Specs
-    p_cfg, default_label = _get_printer_cfg()
+    def send(name: str, p_cfg: Dict[str, Any]) -> None:
+        model = p_cfg["MODEL"]
+        if model not in instructions:
+            instructions[model] = label_instructions(labels, model, code, prepared)
+
+        write_to_printer(name, p_cfg, instructions[model])
+
+    return send_with_failover(code, printer, send)
+
+
+def label_instructions(labels: list[tuple[str | None, Callable[[], Image.Image | None]]], model: str,
+                       label_code: str | None = None, prepared: dict | None = None) -> bytes:
+    """
+    Fertige Druckdaten (Auftragsbeginn + eine Seite je Label) für ein
+    Druckermodell, z. B. für den Druck oder als Raster-Download der API.
+    labels wie bei print_labels; prepared: Ablage der vorbereiteten Bilder,
+    falls die Daten für mehrere Druckermodelle erzeugt werden.
+    """
+    _, default_label = _get_printer_cfg()
     code = label_code or default_label
     spec = _LABEL_SPECS[code]
     width_px, height_px = (spec, spec * 4) if isinstance(spec, int) else spec
-    width_mm = height_px / 300 * 25.4  # mm für WeasyPrint
-    height_mm = width_px / 300 * 25.4  # mm für WeasyPrint
-    
-    # 2) HTML → PNG
-    img = render_html_to_png(html, width_mm, height_mm)
-
-    # 3) Einpassen (niemals Beschnitt)
-    img = _scale_image_to_label(img, height_px, width_px)
+    settings = (
+        get_plugin_config("netbox_qrcode", "print_dither", "threshold"),
+        get_plugin_config("netbox_qrcode", "print_threshold", 70),
+    )
+    prepared = {} if prepared is None else prepared
 
-    #4) Ausrichtung: Breite/Höhe vertauscht?
-    img = _orient_image(img, width_px, height_px)
+    def prepare(index: int) -> Image.Image | None:
+        if index not in prepared:
+            img = labels[index][1]()
+            if img is not None and img.size != (width_px, height_px):
+                # Nicht bereits in Druckgröße und Hochformat (render_html_to_label_image)?
+                with span("scale_orient", label=code):
+                    # 3) Einpassen (niemals Beschnitt)
+                    img = _scale_image_to_label(img, height_px, width_px)
 
-    # 5) Am Brother erst *jetzt* drehen: Hochformat-Labels → 90 °
-    rotate_mode = "0"
+                    #4) Ausrichtung: Breite/Höhe vertauscht?
+                    img = _orient_image(img, width_px, height_px)
+            prepared[index] = img
+        return prepared[index]
 
-    # 6) In Brother-Raster wandeln und senden
-    raster = BrotherQLRaster(p_cfg["MODEL"])
-    instr = convert(raster, [img], label=code, rotate=rotate_mode)
+    pages = []
+    for index, (key, _) in enumerate(labels):
+        page_key = make_key(key, model, code, *settings) if key is not None else None
+        page = raster_cache.get(page_key) if page_key else None
+        if page is None:
+            img = prepare(index)
+            if img is None:
+                continue
+            with span("brother_ql_convert", model=model):
+                page = _convert_page(model, img, code)
+            if page_key:
+                raster_cache.set(page_key, page)
+        pages.append(page)
 
-    backend_cls = backend_factory(p_cfg["BACKEND"])["backend_class"]
-    backend_cls(p_cfg["ADDRESS"]).write(instr)
+    if not pages:
+        raise ValueError("Keine Labels zum Drucken.")
+    return _preamble(model) + b"".join(pages)
 
 
 # ---------------------------------------------------------------------------
@@ -121,8 +406,11 @@ def print_label_from_html(html: str, label_code: str | None = None) -> None:
 def extract_label_html(rendered_html: str, div_id: str) -> str:
     """Extrahiert den Label‑Container und setzt ihn in ein Minimal‑HTML."""
 
-    soup = BeautifulSoup(rendered_html, "html.parser")
-    label_div = soup.find(id=div_id)
+    from bs4 import BeautifulSoup
+
+    with span("extract_label_html"):
+        soup = BeautifulSoup(rendered_html, "html.parser")
+        label_div = soup.find(id=div_id)
     if label_div is None:
         raise RuntimeError(f"DIV #{div_id} nicht gefunden – Template evtl. geändert?")
 
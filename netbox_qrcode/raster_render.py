@@ -0,0 +1,203 @@
+import shutil
+import subprocess
+from functools import lru_cache
+
+from PIL import Image, ImageDraw, ImageFont
+
+# ---------------------------------------------------------------------------
+# Direkter Raster-Renderer für die Standard-Layouts von qrcode3.html
+# (nur QR, Text links/rechts/oben/unten, nur Text).
+# Zeichnet QR-Matrix und Text ohne HTML → WeasyPrint → PDF → pdfium direkt
+# auf ein 1-Bit-Bild in der Pixelgröße des Druckers.  Labels mit
+# text_template werden weiterhin über WeasyPrint gerendert.
+# ---------------------------------------------------------------------------
+
+_DPI = 300
+_LINE_HEIGHT = 1.2  # entspricht CSS "line-height: normal"
+
+# Maße, die für das Layout in mm vorliegen müssen
+_REQUIRED_DIMENSIONS = (
+    "font_size", "label_qr_width", "label_qr_height", "label_qr_text_distance",
+    "label_edge_top", "label_edge_left", "label_edge_right", "label_edge_bottom",
+)
+
+
+def _px(mm: float) -> int:
+    return round(mm * _DPI / 25.4)
+
+
+def can_render_raster(config, text: str | None) -> bool:
+    """
+    Prüft, ob das Label ohne WeasyPrint gezeichnet werden kann:
+    kein text_template, alle Maße in mm umrechenbar und reiner Text
+    (nur <br> als Zeilenumbruch).
+    """
+    if config.get("print_renderer") == "weasyprint":
+        return False
+    if config.get("with_text") and config.get("text_template"):
+        return False
+    # Ohne Schriftdatei nur, wenn fontconfig dieselbe Schrift wie WeasyPrint liefert
+    if config.get("with_text") and not config.get("font_file") and _font_path(config) is None:
+        return False
+
+    dimensions = getattr(config, "dimensions", None)
+    if dimensions is None or any(dimensions.get(key) is None for key in _REQUIRED_DIMENSIONS):
+        return False
+
+    if text and "<" in text.replace("<br>", ""):
+        return False
+    return True
+
+
+@lru_cache(maxsize=32)
+def _match_font(family: str, bold: bool) -> str | None:
+    """
+    Sucht die Schriftdatei über fontconfig (fc-match), wie WeasyPrint/Pango
+    die Schrift auswählt – inklusive Ersatzschrift, falls die Familie fehlt.
+    None, wenn fontconfig nicht installiert ist.
+    """
+    fc_match = shutil.which("fc-match")
+    if fc_match is None:
+        return None
+    try:
+        result = subprocess.run(
+            [fc_match, "--format=%{file}", f"{family}:weight={'bold' if bold else 'regular'}"],
+            capture_output=True, text=True, timeout=5, check=True,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None
+
+
+def _font_path(config) -> str | None:
+    # Erste Schrift der CSS-Liste, z. B. "'Trebuchet MS', Arial" → "Trebuchet MS"
+    family = str(config.get("font") or "").split(",")[0].strip().strip("'\"")
+    weight = str(config.get("font_weight") or "normal")
+    bold = weight in ("bold", "bolder") or (weight.isdigit() and int(weight) >= 600)
+    return config.get("font_file") or _match_font(family, bold)
+
+
+@lru_cache(maxsize=32)
+def _load_font(path: str, size_px: int) -> ImageFont.ImageFont:
+    return ImageFont.truetype(path, size_px)
+
+
+def _font_for(config) -> ImageFont.ImageFont:
+    size_px = max(1, _px(config.dimensions["font_size"]))
+    return _load_font(_font_path(config), size_px)
+
+
+def _wrap(draw: ImageDraw.ImageDraw, text: str, font, width: int) -> list[str]:
+    """Bricht den Text wie der Browser an Wortgrenzen auf die Breite um."""
+    lines = []
+    for paragraph in text.split("<br>"):
+        words = paragraph.split()
+        line = ""
+        for word in words:
+            candidate = f"{line} {word}" if line else word
+            if line and draw.textlength(candidate, font=font) > width:
+                lines.append(line)
+                line = word
+            else:
+                line = candidate
+        lines.append(line)
+    return lines
+
+
+def _draw_text(canvas: Image.Image, box: tuple[int, int, int, int], text: str, config) -> None:
+    """Zeichnet den Text in die Box (x, y, Breite, Höhe); Überstand wird abgeschnitten."""
+    x, y, width, height = box
+    if width <= 0 or height <= 0 or not text:
+        return
+
+    area = Image.new("1", (width, height), 1)
+    draw = ImageDraw.Draw(area)
+    font = _font_for(config)
+    line_height = round(font.size * _LINE_HEIGHT)
+    lines = _wrap(draw, text, font, width)
+    text_height = line_height * len(lines)
+
+    valign = config.get("text_align_vertical")
+    if valign == "top":
+        top = 0
+    elif valign == "bottom":
+        top = height - text_height
+    else:
+        top = (height - text_height) // 2
+
+    halign = config.get("text_align_horizontal")
+    for i, line in enumerate(lines):
+        line_width = draw.textlength(line, font=font)
+        if halign == "center":
+            left = (width - line_width) / 2
+        elif halign == "right":
+            left = width - line_width
+        else:
+            left = 0
+        # Schrift vertikal in der Zeile zentrieren (Halbabstand wie im Browser)
+        draw.text((left, top + i * line_height + (line_height - font.size) / 2), line, font=font, fill=0)
+
+    canvas.paste(area, (x, y))
+
+
+def _draw_qr(canvas: Image.Image, box: tuple[int, int, int, int], matrix) -> None:
+    """Skaliert die QR-Matrix (Modul für Modul, ohne Glättung) in die Box."""
+    x, y, width, height = box
+    if width <= 0 or height <= 0 or not matrix:
+        return
+
+    size = len(matrix)
+    qr = Image.new("1", (size, size), 1)
+    qr.putdata([0 if module else 1 for row in matrix for module in row])
+    canvas.paste(qr.resize((width, height), Image.NEAREST), (x, y))
+
+
+def render_label_raster(config, matrix, text: str | None, size_px: tuple[int, int]) -> Image.Image:
+    """
+    Zeichnet das Label in der Zielgröße size_px = (Breite, Höhe) bei 300 dpi.
+    Das Layout entspricht qrcode3.html, die Label-Größe ist die Druckseite.
+    """
+    width, height = size_px
+    canvas = Image.new("1", (width, height), 1)
+    dims = config.dimensions
+
+    top, bottom = _px(dims["label_edge_top"]), _px(dims["label_edge_bottom"])
+    left, right = _px(dims["label_edge_left"]), _px(dims["label_edge_right"])
+    qr_w, qr_h = _px(dims["label_qr_width"]), _px(dims["label_qr_height"])
+    distance = _px(dims["label_qr_text_distance"])
+
+    with_qr = config.get("with_qr") is True
+    with_text = config.get("with_text") is True  # Leerer Text: Layout wie qrcode3.html, _draw_text zeichnet nichts
+    location = config.get("text_location")
+
+    # Nur QR-Code: mittig auf dem Label
+    if with_qr and not with_text:
+        _draw_qr(canvas, ((width - qr_w) // 2, (height - qr_h) // 2, qr_w, qr_h), matrix)
+
+    # Nur Text
+    elif with_text and not with_qr:
+        _draw_text(canvas, (left, top, width - left - right, height - top), text, config)
+
+    # Text rechts/links vom QR-Code
+    elif with_qr and location in ("right", "left"):
+        text_w = width - left - right - qr_w - distance
+        qr_y = top + (height - top - qr_h) // 2
+        if location == "right":
+            _draw_qr(canvas, (left, qr_y, qr_w, qr_h), matrix)
+            _draw_text(canvas, (left + qr_w + distance, top, text_w, height - top), text, config)
+        else:
+            _draw_text(canvas, (left, top, text_w, height - top), text, config)
+            _draw_qr(canvas, (left + text_w + distance, qr_y, qr_w, qr_h), matrix)
+
+    # Text unter/über dem QR-Code
+    elif with_qr:
+        text_h = height - top - bottom - qr_h - distance
+        qr_x = left + (width - left - right - qr_w) // 2
+        if location == "down":
+            _draw_qr(canvas, (qr_x, top, qr_w, qr_h), matrix)
+            _draw_text(canvas, (left, top + qr_h + distance, width - left - right, text_h), text, config)
+        else:
+            _draw_text(canvas, (left, top, width - left - right, text_h), text, config)
+            _draw_qr(canvas, (qr_x, top + text_h + distance, qr_w, qr_h), matrix)
+
+    return canvas
@@ -0,0 +1,221 @@
+import uuid
+from functools import partial
+
+from django.apps import apps
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist, FieldError
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from netbox.plugins.utils import get_plugin_config
+
+from .cache import make_key
+from .label_config import MODELS, get_label_config, get_label_design_numbers
+from .prefetch import _ALIASES
+
+# ******************************************************************************************
+# Versions of the objects with labels, used as part of the cache keys of labels.
+# Each object has a version token in the Django cache, which changes when the object is saved
+# or deleted (for cables also when a termination changes). In addition each model has a
+# token that changes when a related object used in the label text changes (e.g. the site
+# in 'site.name'). Together with last_updated and the hash of the label configuration,
+# every change of the label content or of the plugin configuration leads to new cache keys.
+# The tokens expire with the longest timeout of the label caches (older cache entries are
+# gone by then anyway), tokens of deleted objects are removed.
+# ******************************************************************************************
+
+def _version_key(model_name, pk=None):
+    if pk is None:
+        return f'netbox_qrcode:version:{model_name}'
+    return f'netbox_qrcode:version:{model_name}:{pk}'
+
+def _version_timeout():
+    return max(
+        get_plugin_config('netbox_qrcode', 'render_cache_timeout', 3600),
+        get_plugin_config('netbox_qrcode', 'raster_cache_timeout', 7 * 86400),
+    )
+
+##################################
+# Changes the version of an object or, without pk, of all objects of a model.
+# --------------------------------
+# Parameter:
+#   model_name: Model name without app label (e.g. device)
+#   pk: ID of the object (None = all objects of the model)
+def bump_version(model_name, pk=None):
+    cache.set(_version_key(model_name, pk), uuid.uuid4().hex, _version_timeout())
+
+##################################
+# Changes the versions of several objects with one cache call.
+def bump_versions(model_name, pks):
+    if pks:
+        cache.set_many({_version_key(model_name, pk): uuid.uuid4().hex for pk in pks}, _version_timeout())
+
+##################################
+# Returns the version of the label of an object, to be used as part of a cache key.
+# Missing tokens (e.g. after a cache flush) are created as new random values, so an
+# expired token can never lead back to an old cache entry.
+# --------------------------------
+# Parameter:
+#   obj: Data from the model (e.g. device, rack, etc.)
+#   config: LabelConfig of the label design
+def get_label_version(obj, config):
+    model_name = obj._meta.model_name
+    keys = [_version_key(model_name, obj.pk), _version_key(model_name)]
+
+    tokens = cache.get_many(keys)
+    for key in keys:
+        if key not in tokens:
+            cache.add(key, uuid.uuid4().hex, _version_timeout())
+            tokens[key] = cache.get(key)
+
+    return make_key(getattr(obj, 'last_updated', None), tokens[keys[0]], tokens[keys[1]], config.hash)
+
+##################################
+# Returns a key for the content of a label, e.g. for the cached printer data.
+# The host is part of the QR code URL.
+# --------------------------------
+# Parameter:
+#   obj: Data from the model (e.g. device, rack, etc.)
+#   config: LabelConfig of the label design
+#   label_design_no: Number of the label design
+#   host: Host of the request (request.get_host())
+def get_label_key(obj, config, label_design_no, host):
+    return make_key(obj._meta.model_name, obj.pk, get_label_version(obj, config), label_design_no, host)
+
+# --- Receivers -------------------------------------------------------------------------------
+
+def _object_changed(sender, instance, model_name, **kwargs):
+    bump_version(model_name, instance.pk)
+
+def _object_deleted(sender, instance, model_name, **kwargs):
+    cache.delete(_version_key(model_name, instance.pk)) # A missing token is never an old one
+
+# The through model of the tags (extras.TaggedItem) is shared by all tagged models, so the
+# signal also arrives for tags of other models: only objects of model_class are counted.
+def _tags_changed(sender, instance, model_name, model_class, action, reverse, model, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        if isinstance(instance, model_class):
+            bump_version(model_name, instance.pk)
+    elif pk_set and issubclass(model, model_class): # pk_set contains objects of model
+        for pk in pk_set: # Tag changed on several objects
+            bump_version(model_name, pk)
+
+# Only the labels that reference the changed object get a new version, if the relation can be
+# queried (lookups such as 'site' or 'site__region'). Otherwise, and on delete (referencing
+# objects may already be updated without signals, e.g. SET_NULL), all labels of the model.
+def _related_changed(sender, instance, model_name, lookups, **kwargs):
+    if None in lookups or kwargs['signal'] is post_delete:
+        bump_version(model_name)
+        return
+
+    model = apps.get_model('dcim', model_name)
+    pks = set()
+    try:
+        for lookup in lookups:
+            pks.update(model.objects.filter(**{lookup: instance.pk}).values_list('pk', flat=True))
+    except (FieldError, ValueError):
+        bump_version(model_name)
+        return
+    bump_versions(model_name, pks)
+
+def _termination_changed(sender, instance, **kwargs):
+    if getattr(instance, 'cable_id', None):
+        bump_version('cable', instance.cable_id)
+
+##################################
+# Returns the models that can be cabled (interfaces, front ports, power feeds etc.).
+def _termination_models():
+    cable = apps.get_model('dcim', 'cable')
+    models = set()
+    for model in apps.get_models():
+        try:
+            field = model._meta.get_field('cable')
+        except FieldDoesNotExist:
+            continue
+        if field.is_relation and field.related_model is cable:
+            models.add(model)
+    return models
+
+##################################
+# Returns the models that a relation path of a label leads to, with the lookups from the
+# model of the label to them (e.g. 'site__region'; None if the relation cannot be queried).
+# --------------------------------
+# Parameter:
+#   model: Model of the label (e.g. Device)
+#   path: Relation path from get_prefetch_paths(), e.g. ('site', 'region')
+def _related_models(model, path):
+    found = {}
+    level = {(model, '')}
+
+    for hop in path:
+        next_level = set()
+        for current, lookup in level:
+            if (current._meta.label_lower, hop) in _ALIASES:
+                # a_terminations / b_terminations: generic relation to all cabled models.
+                # Changes of the terminations themselves only change their cable (see connect_signals).
+                next_level |= {(termination, None) for termination in _termination_models()}
+                continue
+            try:
+                field = current._meta.get_field(hop)
+            except FieldDoesNotExist:
+                continue
+            if field.is_relation and field.related_model is not None:
+                related_lookup = lookup and f'{lookup}__{hop}' # None stays None
+                if lookup == '':
+                    related_lookup = hop
+                next_level.add((field.related_model, related_lookup))
+                found.setdefault(field.related_model, set()).add(related_lookup)
+
+        level = next_level
+
+    return found
+
+##################################
+# Connects the receivers for all models with labels (called at startup).
+def connect_signals():
+    for model_name in MODELS:
+        label_designs = get_label_design_numbers(model_name)
+        if not label_designs:
+            continue
+        model = apps.get_model('dcim', model_name)
+
+        # The object itself
+        post_save.connect(
+            partial(_object_changed, model_name=model_name), sender=model,
+            weak=False, dispatch_uid=f'netbox_qrcode_{model_name}',
+        )
+        post_delete.connect(
+            partial(_object_deleted, model_name=model_name), sender=model,
+            weak=False, dispatch_uid=f'netbox_qrcode_{model_name}',
+        )
+
+        tags = getattr(model, 'tags', None)
+        if tags is not None and hasattr(tags, 'through'):
+            m2m_changed.connect(
+                partial(_tags_changed, model_name=model_name, model_class=model), sender=tags.through,
+                weak=False, dispatch_uid=f'netbox_qrcode_{model_name}_tags',
+            )
+
+        # Related objects in the label text (e.g. site, rack, termination device)
+        related = {}
+        for label_design_no in label_designs:
+            for path in get_label_config(model_name, label_design_no).prefetch_paths:
+                for related_model, lookups in _related_models(model, path).items():
+                    related.setdefault(related_model, set()).update(lookups)
+
+        for related_model, lookups in related.items():
+            receiver = partial(_related_changed, model_name=model_name, lookups=frozenset(lookups))
+            for signal in (post_save, post_delete):
+                signal.connect(
+                    receiver, sender=related_model, weak=False,
+                    dispatch_uid=f'netbox_qrcode_{model_name}_{related_model._meta.label_lower}',
+                )
+
+    # Cables: terminations are separate objects, their changes do not touch the cable itself
+    if get_label_design_numbers('cable'):
+        for model in [apps.get_model('dcim', 'cabletermination'), *_termination_models()]:
+            for signal in (post_save, post_delete):
+                signal.connect(
+                    _termination_changed, sender=model, weak=False,
+                    dispatch_uid=f'netbox_qrcode_termination_{model._meta.label_lower}',
+                )
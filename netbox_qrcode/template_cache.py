@@ -0,0 +1,50 @@
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+from django.template import TemplateSyntaxError, engines
+
+# ******************************************************************************************
+# Registry of compiled user templates ('url_template', 'text_template').
+# A template string is only lexed and parsed once and then reused for every request.
+# ******************************************************************************************
+
+TEMPLATE_KEYS = ('url_template', 'text_template')
+
+_compiled = {}
+_lock = threading.Lock()
+
+##################################
+# Returns the compiled Django template for a template string.
+# --------------------------------
+# Parameter:
+#   source: Template string from the configuration
+def get_template(source):
+    template = _compiled.get(source)
+    if template is None:
+        template = engines['django'].from_string(source)
+        with _lock:
+            _compiled[source] = template
+    return template
+
+##################################
+# Compiles all templates of the plugin configuration, so that syntax errors already
+# appear when NetBox starts and not only when a label is displayed.
+# --------------------------------
+# Parameter:
+#   config: Plugin configuration (PLUGINS_CONFIG['netbox_qrcode'])
+def compile_config_templates(config):
+
+    # Global templates and templates of the module configurations (device, device_2, rack etc.)
+    sections = [('', config)]
+    sections += [(name, value) for name, value in config.items() if isinstance(value, dict)]
+
+    for name, section in sections:
+        for key in TEMPLATE_KEYS:
+            source = section.get(key)
+            if not source:
+                continue
+            try:
+                get_template(source)
+            except TemplateSyntaxError as exc:
+                setting = f"{name}.{key}" if name else key
+                raise ImproperlyConfigured(f"netbox_qrcode: invalid template in '{setting}': {exc}")
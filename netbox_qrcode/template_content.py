@@ -1,17 +1,18 @@
-import base64
 from io import BytesIO
 
 from packaging import version
 from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
 from netbox.plugins import PluginTemplateExtension
-from .template_content_functions import create_text, create_url, config_for_modul, create_QRCode, mm2px, mm2csspx
+from .template_content_functions import create_text, create_url, config_for_modul, create_QRCode, create_QRMatrix, mm2px, mm2csspx
+from .label_config import get_label_config, get_label_design_numbers
+from .prefetch import prefetch_label_objects
+from .jobs import enqueue_print_job, DONE, FAILED
+from .metrics import span
 
 from django.contrib import messages
 from django.template.loader import render_to_string
-from .printing import (
-    print_label_from_html, _get_printer_cfg, _LABEL_SPECS, extract_label_html, render_html_to_png
-)
+from django.urls import reverse
 
 # ******************************************************************************************
 # Contains the main functionalities of the plugin and thus creates the content for the 
@@ -23,11 +24,13 @@ from .printing import (
 class QRCode(PluginTemplateExtension):
 
     ##################################          
-    # Creates a plug-in view for a label.
+    # Creates the content of a label that is needed for it (config, URL, QR code, text).
     # --------------------------------
     # Parameter:
     #   labelDesignNo: Which label design should be loaded.
-    def Create_SubPluginContent(self, labelDesignNo):
+    # Return:
+    #   (config, url, qrCode, text) or None if the label design is not configured.
+    def Create_LabelData(self, labelDesignNo):
 
         thisSelf = self
 
@@ -38,45 +41,79 @@ class QRCode(PluginTemplateExtension):
 
         # Abort if no config data. 
         if config is None: 
-            return '' 
+            return None
+
+        # Load the related objects for URL and text in batched queries.
+        prefetch_label_objects(obj, config.prefetch_paths)
 
         # Get URL for QR code
         url = create_url(thisSelf, config, obj)
 
         # Create a QR code
-        qrCode = create_QRCode(url, config)
+        with span('qr_code'):
+            qrCode = create_QRCode(url, config)
 
         # Create the text for the label if required.
-        text = create_text(config, obj, qrCode)
+        with span('label_text'):
+            text = create_text(config, obj, qrCode)
 
-        request = self.context['request'] 
+        return config, url, qrCode, text
 
-        # -------- Direktdruck ODER Vorschau ----------
-        if request.GET.get("direct_print") == str(labelDesignNo) or \
-           request.GET.get("show_png")     == str(labelDesignNo) or \
-           request.GET.get("show_pdf")  == str(labelDesignNo):
-
-
-            # 0) Breite/Höhe des Ziel-Labels in px (Brother-Spezifikation)
-            p_cfg, code = _get_printer_cfg()
-            spec = _LABEL_SPECS[code]
-            width_px, height_px = (spec, spec * 4) if isinstance(spec, int) else spec
+    ##################################          
+    # Renders a label in the size of the printer label (PNG/PDF preview, direct print).
+    # --------------------------------
+    # Parameter:
+    #   labelDesignNo: Which label design should be loaded.
+    #   kind: 'png' (PNG bytes), 'pdf' (PDF bytes) or 'image' (PIL image for the printer, see jobs.run_print_job)
+    # Return:
+    #   PNG/PDF bytes, PIL image or None if the label design is not configured.
+    def Create_LabelOutput(self, labelDesignNo, kind):
+
+        label_data = QRCode.Create_LabelData(self, labelDesignNo)
+        if label_data is None:
+            return None
+        config, url, qrCode, text = label_data
+
+        # Render-/Druck-Stack erst bei Bedarf laden (nicht beim Start jedes NetBox-Workers)
+        from .printing import _get_printer_cfg, _LABEL_SPECS, extract_label_html, is_red_label
+        from .html_render import render_label_bytes, render_html_to_label_image
+        from .raster_render import can_render_raster, render_label_raster
+
+        obj = self.context['object']
+        request = self.context['request']
 
-            #Tausche Breite/Höhe, weil Papierformat = Hochformat aber Label-Designs = Querformat und rechne in mm um
-            width_mm = height_px / 300 * 25.4  # mm für WeasyPrint
-            height_mm = width_px / 300 * 25.4  # mm für WeasyPrint
+        # 0) Breite/Höhe des Ziel-Labels in px (Brother-Spezifikation)
+        p_cfg, code = _get_printer_cfg()
+        spec = _LABEL_SPECS[code]
+        width_px, height_px = (spec, spec * 4) if isinstance(spec, int) else spec
 
-            # 1) mm-Angaben → px-Strings bei 300 dpi
-            def _mm_to_px_str(val):
-                if isinstance(val, str) and val.endswith("mm"):
-                    return f"{mm2csspx(val)}px"
-                return val
+        #Tausche Breite/Höhe, weil Papierformat = Hochformat aber Label-Designs = Querformat und rechne in mm um
+        width_mm = height_px / 300 * 25.4  # mm für WeasyPrint
+        height_mm = width_px / 300 * 25.4  # mm für WeasyPrint
 
-            px_cfg = {k: _mm_to_px_str(v) for k, v in config.items()}
-            px_cfg["label_width"]  = f"{mm2csspx(width_mm)}px"
-            px_cfg["label_height"] = f"{mm2csspx(height_mm)}px"
+        # Standard-Layouts ohne WeasyPrint direkt als 1-Bit-Raster zeichnen (PNG-Vorschau und Druck)
+        if kind != "pdf" and can_render_raster(config, text):
+            with span('raster_render'):
+                label_img = render_label_raster(config, create_QRMatrix(url, config), text, (height_px, width_px))
 
-            # 2) qrcode3.html rendern (Card + Label-DIV)
+            if kind == "png":
+                buf = BytesIO()
+                label_img.save(buf, format="PNG")
+                return buf.getvalue()
+            return label_img
+
+        # 1) mm-Angaben → px-Strings bei 300 dpi
+        def _mm_to_px_str(val):
+            if isinstance(val, str) and val.endswith("mm"):
+                return f"{mm2csspx(val)}px"
+            return val
+
+        px_cfg = {k: _mm_to_px_str(v) for k, v in config.items()}
+        px_cfg["label_width"]  = f"{mm2csspx(width_mm)}px"
+        px_cfg["label_height"] = f"{mm2csspx(height_mm)}px"
+
+        # 2) qrcode3.html rendern (Card + Label-DIV)
+        with span('template_render', template='qrcode3.html'):
             rendered = render_to_string(
                 "netbox_qrcode/qrcode3.html",
                 {
@@ -89,71 +126,106 @@ class QRCode(PluginTemplateExtension):
                 request=request,
             )
 
-            div_id = f"QR-Code-Label_{labelDesignNo}"
-            html_label = extract_label_html(rendered, div_id)
+        div_id = f"QR-Code-Label_{labelDesignNo}"
+        html_label = extract_label_html(rendered, div_id)
 
-            # --- PNG-Vorschau? -------------------------------------------
-            if request.GET.get("show_png") == str(labelDesignNo):
-                # HTML → PNG
-                buf = BytesIO()
-                render_html_to_png(html_label, width_mm, height_mm).save(buf, format="PNG")
-                data_uri = "data:image/png;base64," + base64.b64encode(buf.getvalue()).decode()
-                # Bild als ganz normales <img> zurückgeben
-                return f'<img src="{data_uri}" alt="Label Preview" style="max-width:100%;border:1px solid #ccc"/>'
-            
-            if request.GET.get("show_pdf") == str(labelDesignNo):
-                # HTML → PDF
-                pdf_bytes = render_html_to_png(html_label, width_mm, height_mm, want_pdf=True)
-                # PDF einbetten aus BytesIO
-
-                data_uri = "data:application/pdf;base64," + base64.b64encode(pdf_bytes).decode()
-                return f'<object data="{data_uri}" type="application/pdf" style="width:100%;height:600px;border:1px solid #ccc">\
-                        <p>Ihr Browser kann keine eingebetteten PDFs anzeigen.\n\
-                        <a href="{data_uri}">PDF herunterladen</a></p>\
-                    </object>'
-            # ---------------------------------------------------------------
-
-            # 4) Drucken
-            try:
-                print_label_from_html(html_label, code)
-                messages.success(request, "Label wurde gedruckt.")
-            except Exception as exc:
-                messages.error(request, f"Druckfehler: {exc}")
+        # 3) HTML → PNG/PDF oder Bild für den Drucker
+        if kind in ("png", "pdf"):
+            return render_label_bytes(html_label, width_mm, height_mm, kind)
 
+        # Bild: direkt in Druckgröße und Hochformat rastern (kein Resample/Drehen in PIL)
+        return render_html_to_label_image(html_label, width_mm, height_mm, (width_px, height_px),
+                                          grayscale=not is_red_label(code))
 
+    ##################################          
+    # URL of a plugin view for a label of this object (see urls.py).
+    # --------------------------------
+    # Parameter:
+    #   labelDesignNo: Which label design should be loaded.
+    #   name: Name of the URL, e.g. 'label', 'label_png', 'label_pdf'
+    def Get_LabelURL(self, labelDesignNo, name):
+        return reverse(f'plugins:netbox_qrcode:{name}', kwargs={
+            'model_name': self.models[0].replace('dcim.', ''),
+            'pk': self.context['object'].pk,
+            'label_design_no': labelDesignNo,
+        })
+
+    ##################################          
+    # Creates a plug-in view for a label.
+    # --------------------------------
+    # Parameter:
+    #   labelDesignNo: Which label design should be loaded.
+    def Create_SubPluginContent(self, labelDesignNo):
+
+        label_data = QRCode.Create_LabelData(self, labelDesignNo)
+
+        # Abort if no config data. 
+        if label_data is None: 
+            return '' 
+        config, url, qrCode, text = label_data
+
+        obj = self.context['object'] # An object of the type Device, Rack etc.
+        request = self.context['request'] 
+
+        # -------- Vorschau: Bild/PDF werden vom Browser separat geladen (label_png / label_pdf) ----------
+        if request.GET.get("show_png") == str(labelDesignNo):
+            png_url = QRCode.Get_LabelURL(self, labelDesignNo, 'label_png')
+            return f'<img src="{png_url}" alt="Label Preview" style="max-width:100%;border:1px solid #ccc"/>'
+
+        if request.GET.get("show_pdf") == str(labelDesignNo):
+            pdf_url = QRCode.Get_LabelURL(self, labelDesignNo, 'label_pdf')
+            return f'<object data="{pdf_url}" type="application/pdf" style="width:100%;height:600px;border:1px solid #ccc">\
+                    <p>Ihr Browser kann keine eingebetteten PDFs anzeigen.\n\
+                    <a href="{pdf_url}">PDF herunterladen</a></p>\
+                </object>'
+
+        # -------- Direktdruck (als Druckauftrag im Hintergrund, siehe jobs.py) ----------
+        if request.GET.get("direct_print") == str(labelDesignNo):
+            job = enqueue_print_job(request, self.models[0].replace('dcim.', ''), [obj.pk], labelDesignNo)
+            if job['status'] == DONE:
+                messages.success(request, "Label wurde gedruckt.")
+            elif job['status'] == FAILED:
+                messages.error(request, f"Druckfehler: {job.get('error')}")
+            else:
+                status_url = reverse('plugins:netbox_qrcode:print_job', kwargs={'job_id': job['id']})
+                messages.info(request, f"Druckauftrag wurde eingereiht (Status: {status_url}).")
 
         # Create plugin using template
         try:
             if version.parse(settings.RELEASE.version).major >= 3:
 
-                render = self.render(
-                    'netbox_qrcode/qrcode3.html', extra_context={
-                                                                    'object': obj,
-                                                                    'title': config.get('title'),
-                                                                    'labelDesignNo': labelDesignNo,
-                                                                    'qrCode': qrCode, 
-                                                                    'with_text': config.get('with_text'),
-                                                                    'text': text,
-                                                                    'text_location': config.get('text_location'),
-                                                                    'text_align_horizontal': config.get('text_align_horizontal'),
-                                                                    'text_align_vertical': config.get('text_align_vertical'),
-                                                                    'font': config.get('font'),
-                                                                    'font_size': config.get('font_size'),
-                                                                    'font_weight': config.get('font_weight'),
-                                                                    'font_color': config.get('font_color'),
-                                                                    'with_qr': config.get('with_qr'),
-                                                                    'label_qr_width': config.get('label_qr_width'),
-                                                                    'label_qr_height': config.get('label_qr_height'),
-                                                                    'label_qr_text_distance': config.get('label_qr_text_distance'),
-                                                                    'label_width': config.get('label_width'),
-                                                                    'label_height': config.get('label_height'), 
-                                                                    'label_edge_top': config.get('label_edge_top'),
-                                                                    'label_edge_left': config.get('label_edge_left'),
-                                                                    'label_edge_right': config.get('label_edge_right'),
-                                                                    'label_edge_bottom': config.get('label_edge_bottom')
-                                                                }
-
-                )
+                with span('template_render', template='qrcode3.html'):
+                    render = self.render(
+                        'netbox_qrcode/qrcode3.html', extra_context={
+                                                                        'object': obj,
+                                                                        'title': config.get('title'),
+                                                                        'labelDesignNo': labelDesignNo,
+                                                                        'qrCode': qrCode, 
+                                                                        'with_text': config.get('with_text'),
+                                                                        'text': text,
+                                                                        'text_location': config.get('text_location'),
+                                                                        'text_align_horizontal': config.get('text_align_horizontal'),
+                                                                        'text_align_vertical': config.get('text_align_vertical'),
+                                                                        'font': config.get('font'),
+                                                                        'font_size': config.get('font_size'),
+                                                                        'font_weight': config.get('font_weight'),
+                                                                        'font_color': config.get('font_color'),
+                                                                        'with_qr': config.get('with_qr'),
+                                                                        'qr_format': config.get('qr_format'),
+                                                                        'label_qr_width': config.get('label_qr_width'),
+                                                                        'label_qr_height': config.get('label_qr_height'),
+                                                                        'label_qr_text_distance': config.get('label_qr_text_distance'),
+                                                                        'label_width': config.get('label_width'),
+                                                                        'label_height': config.get('label_height'), 
+                                                                        'label_edge_top': config.get('label_edge_top'),
+                                                                        'label_edge_left': config.get('label_edge_left'),
+                                                                        'label_edge_right': config.get('label_edge_right'),
+                                                                        'label_edge_bottom': config.get('label_edge_bottom'),
+                                                                        'preview_png_url': QRCode.Get_LabelURL(self, labelDesignNo, 'label_png'),
+                                                                        'preview_pdf_url': QRCode.Get_LabelURL(self, labelDesignNo, 'label_pdf'),
+                                                                    }
+
+                    )
             
                 return render
             else:
@@ -164,6 +236,48 @@ class QRCode(PluginTemplateExtension):
         except ObjectDoesNotExist:
             return ''
 
+    ##################################
+    # Creates a lightweight placeholder for a label.
+    # The label itself is loaded by the browser (HTMX) from the plugin URL as soon as the
+    # placeholder becomes visible, so the detail page does not wait for QR code and label rendering.
+    # --------------------------------
+    # Parameter:
+    #   labelDesignNo: Which label design should be loaded.
+    #   config: Config suitable for the module and label design.
+    def Create_LazySubPluginContent(self, labelDesignNo, config):
+
+        obj = self.context['object']
+
+        return self.render(
+            'netbox_qrcode/qrcode3_lazy.html', extra_context={
+                                                            'object': obj,
+                                                            'title': config.get('title'),
+                                                            'labelDesignNo': labelDesignNo,
+                                                            'model_name': self.models[0].replace('dcim.', ''),
+                                                        }
+        )
+
+    ##################################
+    # Creates the plug-in view for a label, either directly or as a placeholder ('lazy_load').
+    # Labels that are to be printed or previewed with this request are always created directly.
+    # --------------------------------
+    # Parameter:
+    #   labelDesignNo: Which label design should be loaded.
+    def Create_LabelContent(self, labelDesignNo):
+
+        request = self.context['request']
+        config = config_for_modul(self, labelDesignNo)
+
+        if config is None:
+            return ''
+
+        if config.get('lazy_load') and str(labelDesignNo) not in (request.GET.get("direct_print"),
+                                                                   request.GET.get("show_png"),
+                                                                   request.GET.get("show_pdf")):
+            return QRCode.Create_LazySubPluginContent(self, labelDesignNo, config)
+
+        return QRCode.Create_SubPluginContent(self, labelDesignNo)
+
     ##################################
     # Create plugin content
     # - First, a plugin view is created for the first label.
@@ -179,26 +293,35 @@ class QRCode(PluginTemplateExtension):
             return QRCode.Create_SubPluginContent(self, label_no)
         # -----------------------------------------------------------------
 
-        # First Plugin Content
-        pluginContent = QRCode.Create_SubPluginContent(self, 1)
+        # Plugin content for the first label and for each further configuration of the object, e.g. device_2, device_3 etc.
+        # Up to 10 label configurations (objectName, objectName_2 to ..._10) per object are resolved at startup.
+        pluginContent = str()
 
-        # Check whether there is another configuration for the object, e.g. device, rack, etc.
-        # Support up to 10 additional label configurations (objectName_2 to ..._10) per object (e.g. device, rack, etc.).
+        for i in get_label_design_numbers(self.models[0].replace('dcim.', '')):
+            pluginContent += QRCode.Create_LabelContent(self, i) # Add another plugin view
+        
+        return pluginContent
+    
+    ##################################
+    # Creates the "Print Labels" button for the list view of the model (e.g. device list).
+    # The labels of all selected objects are printed as one print job (see BulkPrintView).
+    def Create_ListButtons(self):
 
-        config = self.context['config'] # Django configuration
+        model_name = self.models[0].replace('dcim.', '')
+        label_designs = [
+            (i, get_label_config(model_name, i).get('title')) for i in get_label_design_numbers(model_name)
+        ]
 
-        for i in range(2, 11):
+        return self.render(
+            'netbox_qrcode/qrcode_list_buttons.html', extra_context={
+                                                            'model_name': model_name,
+                                                            'label_designs': label_designs,
+                                                        }
+        )
 
-            configName = self.models[0].replace('dcim.', '') + '_' + str(i)
-            obj_cfg = config.get(configName) # Load configuration for additional label if possible.
+    def list_buttons(self):
+        return self.Create_ListButtons()
 
-            if(obj_cfg):
-                pluginContent += QRCode.Create_SubPluginContent(self, i) # Add another plugin view
-            else:
-                break
-        
-        return pluginContent
-    
 ##################################
 # The following section serves to integrate the plugin into Netbox Core.
         
@@ -1,36 +1,24 @@
-from .utilities import get_img_b64, get_qr
-from django.template import engines
+from .utilities import get_img_b64, get_png, get_png_1bit, get_qr, get_qr_matrix, get_svg
+from .cache import make_key, qr_cache
+from .template_cache import get_template
+from .label_config import get_label_config
+from .text_fields import compile_text_fields
 
 # ******************************************************************************************
 # For better clarity, the sub-functions of template_content.py have been outsourced.
 # ******************************************************************************************
 
 ##################################
-# The configuration is taken and all fields that are module-specific (e.g. Device, Rack, etc.) are replaced.
+# Returns the configuration in which all fields that are module-specific (e.g. Device, Rack, etc.) are replaced.
+# The configurations are resolved once at startup (see label_config.py).
 # --------------------------------
 # Parameter:
 #   labelDesignNo: Which label design should be loaded.
 #   parentSelf: Self from Parrent Function
+# Return:
+#   LabelConfig or None if the label design is not configured.
 def config_for_modul(parentSelf, labelDesignNo):
-
-    # Copy so that the Runtime data is not changed.
-    config = parentSelf.context['config'].copy() # From Netbox Config File
-
-    # Create suffix to read the correct module configuration.
-    confModulsufix = str() # None if the first standard label
-
-    if(labelDesignNo >= 2):
-            confModulsufix = '_' + str(labelDesignNo)
-
-    # Collect the QR code plugin configuration for the specific object such as device, rack etc.
-    # and overwrite the default configuration fields.
-    obj_cfg = config.get(parentSelf.models[0].replace('dcim.', '') + confModulsufix) # get spezific object settings
-    
-    if obj_cfg is not None: 
-        config.update(obj_cfg) # Ovverride default confiv Values
-        return config
-    else:
-        return config # No module customisation
+    return get_label_config(parentSelf.models[0].replace('dcim.', ''), labelDesignNo)
 
 ##################################
 # Create QR-Code
@@ -38,6 +26,8 @@ def config_for_modul(parentSelf, labelDesignNo):
 # Parameter:
 #   text: Text for QR-Code
 #   config: From the Netbox configuration file
+# Return:
+#   Base64 PNG image (with 'qr_format': 'png_1bit' one pixel per module) or, with 'qr_format': 'svg', inline SVG markup.
 def create_QRCode(text, config):
 
     # Collect the configuration entries that begin with "qr_.
@@ -47,9 +37,62 @@ def create_QRCode(text, config):
         if k.startswith('qr_'):
             qr_args[k.replace('qr_', '')] = v
 
+    # Output format is not a parameter of the QR code itself.
+    qr_format = qr_args.pop('format', 'png')
+
+    # Identical text and settings always result in the same image,
+    # so the image is cached under a hash of both.
+    key = make_key(text, qr_format, sorted(qr_args.items()))
+
     # Create a QR code
-    qrCode = get_qr(text, **qr_args)
-    return get_img_b64(qrCode)
+    if qr_format == 'svg':
+        return qr_cache.get_or_create(key, lambda: get_svg(get_qr_matrix(text, **qr_args)))
+
+    if qr_format == 'png_1bit':
+        return qr_cache.get_or_create(key, lambda: get_png_1bit(get_qr_matrix(text, **qr_args)))
+
+    return qr_cache.get_or_create(key, lambda: get_img_b64(get_qr(text, **qr_args)))
+
+
+##################################
+# Create the QR code as file content (e.g. for the REST API)
+# --------------------------------
+# Parameter:
+#   text: Text for QR-Code
+#   config: From the Netbox configuration file
+#   file_format: 'png' or 'svg'
+# Return:
+#   PNG or SVG bytes
+def create_QRFile(text, config, file_format):
+
+    qr_args = {}
+    for k, v in config.items():
+        if k.startswith('qr_') and k != 'qr_format':
+            qr_args[k.replace('qr_', '')] = v
+
+    key = make_key(text, 'file', file_format, sorted(qr_args.items()))
+
+    if file_format == 'svg':
+        return qr_cache.get_or_create(key, lambda: get_svg(get_qr_matrix(text, **qr_args)).encode('utf-8'))
+
+    return qr_cache.get_or_create(key, lambda: get_png(get_qr(text, **qr_args)))
+
+
+##################################
+# Create the module matrix of the QR code (e.g. for drawing the label directly as raster image)
+# --------------------------------
+# Parameter:
+#   text: Text for QR-Code
+#   config: From the Netbox configuration file
+def create_QRMatrix(text, config):
+
+    qr_args = {}
+    for k, v in config.items():
+        if k.startswith('qr_') and k != 'qr_format':
+            qr_args[k.replace('qr_', '')] = v
+
+    key = make_key(text, 'matrix', sorted(qr_args.items()))
+    return qr_cache.get_or_create(key, lambda: get_qr_matrix(text, **qr_args))
 
 
 ##################################
@@ -65,8 +108,7 @@ def create_url(parentSelf, config, obj):
 
     if config.get('url_template'):
         # A user-defined design specification of the URL is provided in ninja2 format.
-        django_engine = engines["django"]
-        template = django_engine.from_string(config.get('url_template')) # Custom template for URL design.
+        template = get_template(config.get('url_template')) # Custom template for URL design (compiled once).
         return template.render({'obj': obj}) # Replace placeholder
     else:
         return request.build_absolute_uri(obj.get_absolute_url()) # URL to the requested page
@@ -97,12 +139,12 @@ def create_text(config, obj, qrCode):
 #   qrCode: QR-Code Image (To create a freely defined label with QR code.)
 def get_text_template(config, obj, qrCode):
 
-    django_engine = engines["django"]
-    template = django_engine.from_string(config.get('text_template')) # Get Custom Template
+    template = get_template(config.get('text_template')) # Get Custom Template (compiled once)
     logo = config.get('logo')
     return template.render({'obj': obj, 
                             'logo': logo,
-                            'qrCode': qrCode}) # Replace placeholder
+                            'qrCode': qrCode,
+                            'qr_format': config.get('qr_format')}) # Replace placeholder
 
 ##################################
 # Retrieves all values from the object (e.g. device, rack, etc.)
@@ -115,26 +157,15 @@ def get_text_fields(config, obj):
 
     text = []
 
-    for text_field in config.get('text_fields', []):
-        cfn = None
-        if '.' in text_field:
-            try:
-                text_field, cfn = text_field.split('.')
-            except ValueError:
-                cfn = None
-        if getattr(obj, text_field, None):
-            if cfn:
-                try:
-                    if getattr(obj, text_field).get(cfn):
-                        text.append('{}'.format(getattr(obj, text_field).get(cfn)))
-                except AttributeError:
-                    # fix for nb3.3: trying to get cable termination and device in same way as custom field
-                    if type(getattr(obj, text_field)) is list:
-                        first_element = next(iter(getattr(obj, text_field)), None)
-                        if first_element and getattr(first_element, cfn, None):
-                            text.append('{}'.format(getattr(first_element, cfn)))
-            else:
-                text.append('{}'.format(getattr(obj, text_field)))
+    # Accessors are compiled once per label configuration (see text_fields.py).
+    accessors = getattr(config, 'text_field_accessors', None)
+    if accessors is None:
+        accessors = compile_text_fields(config.get('text_fields', []))
+
+    for accessor in accessors:
+        value = accessor(obj)
+        if value:
+            text.append('{}'.format(value))
 
     # Append user-defined text to the end.
     custom_text = config.get('custom_text')
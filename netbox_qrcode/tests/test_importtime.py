@@ -0,0 +1,30 @@
+from django.test import SimpleTestCase
+
+from netbox_qrcode.management.commands.qrcode_benchmark import Command
+
+# ******************************************************************************************
+# Loading the plugin at startup of a NetBox worker must stay cheap: the render and print
+# stack is only imported on the first label (see template_content.py, printing.py).
+# Starts a new Python process with -X importtime (like qrcode_benchmark --importtime).
+# Run with: python manage.py test netbox_qrcode
+# ******************************************************************************************
+
+# Cumulative import time of the plugin modules; generous for slow CI machines.
+IMPORT_BUDGET_MS = 300
+
+
+class ImportTimeTestCase(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.result = Command().measure_importtime()
+
+    def test_no_heavy_modules_on_import(self):
+        self.assertEqual(self.result['heavy_modules'], [])
+
+    def test_import_time_within_budget(self):
+        self.assertLess(
+            self.result['import_ms'], IMPORT_BUDGET_MS,
+            f"Slowest modules: {self.result['slowest_modules']}",
+        )
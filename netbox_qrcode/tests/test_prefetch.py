@@ -0,0 +1,66 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from dcim.models import Cable, Interface
+from utilities.testing import create_test_device
+
+from netbox_qrcode import QRCodeConfig
+from netbox_qrcode.label_config import LabelConfig
+from netbox_qrcode.prefetch import prefetch_label_objects
+from netbox_qrcode.template_content_functions import get_text_fields
+
+# ******************************************************************************************
+# The label text of a cable must be loaded with a constant number of queries,
+# independent of the number of terminations (see prefetch.py).
+# Run with: python manage.py test netbox_qrcode
+# ******************************************************************************************
+
+TERMINATIONS = 5
+
+
+class CableLabelQueryCountTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        def create_interfaces(prefix, count):
+            return [
+                Interface.objects.create(device=create_test_device(f'{prefix} {i}'), name='eth0', type='1000base-t')
+                for i in range(count)
+            ]
+
+        cls.cable_single = Cable(
+            a_terminations=create_interfaces('Single A', 1), b_terminations=create_interfaces('Single B', 1)
+        )
+        cls.cable_single.save()
+
+        cls.cable_multi = Cable(
+            a_terminations=create_interfaces('Multi A', TERMINATIONS),
+            b_terminations=create_interfaces('Multi B', TERMINATIONS),
+        )
+        cls.cable_multi.save()
+
+        # Default label design of cables (a_terminations.device, b_terminations.device, ...)
+        values = dict(QRCodeConfig.default_settings)
+        values.update(values['cable'])
+        cls.config = LabelConfig('cable', 1, values)
+
+    ##################################
+    # Prefetches the label objects and creates the label text of a freshly loaded cable.
+    def render_text(self, cable):
+        prefetch_label_objects(cable, self.config.prefetch_paths)
+        return get_text_fields(self.config, cable)
+
+    def test_queries_independent_of_terminations(self):
+        cable_single = Cable.objects.get(pk=self.cable_single.pk)
+        cable_multi = Cable.objects.get(pk=self.cable_multi.pk)
+
+        with CaptureQueriesContext(connection) as single:
+            text_single = self.render_text(cable_single)
+
+        with self.assertNumQueries(len(single)):
+            text_multi = self.render_text(cable_multi)
+
+        self.assertIn('Single A 0', text_single)
+        self.assertIn('Multi A 0', text_multi)
+        self.assertIn('Multi B 0', text_multi)
@@ -0,0 +1,159 @@
+import socket
+import threading
+import time
+
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+
+from netbox_qrcode import printers
+from netbox_qrcode.printers import PrinterBusy, write_to_printer
+
+# ******************************************************************************************
+# Connections to network printers (see printers.py) against a local fake printer on a
+# free TCP port: reuse of the connection, reconnect after the printer closed it, queue
+# timeout and write timeout.
+# Run with: python manage.py test netbox_qrcode
+# ******************************************************************************************
+
+##################################
+# Listens like a label printer on TCP 9100 and collects the received data.
+# --------------------------------
+# Parameter:
+#   read: False = accept connections but never read (full send buffer)
+#   close_after: Close each connection after this many bytes
+class FakePrinter:
+
+    def __init__(self, read=True, close_after=None):
+        self.read = read
+        self.close_after = close_after
+        self.connections = []
+        self.data = bytearray()
+        self.closed = threading.Event()
+        self.lock = threading.Lock()
+
+        self.server = socket.socket()
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096) # Inherited by accepted sockets
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen()
+        self.address = f'tcp://127.0.0.1:{self.server.getsockname()[1]}'
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            self.connections.append(conn)
+            if self.read:
+                threading.Thread(target=self._receive, args=(conn,), daemon=True).start()
+
+    def _receive(self, conn):
+        received = 0
+        while chunk := conn.recv(65536):
+            with self.lock:
+                self.data += chunk
+            received += len(chunk)
+            if self.close_after and received >= self.close_after:
+                conn.close()
+                self.closed.set()
+                return
+
+    def wait_for(self, size, timeout=5):
+        deadline = time.monotonic() + timeout
+        while len(self.data) < size and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return bytes(self.data)
+
+    def stop(self):
+        self.server.close()
+        for conn in self.connections:
+            conn.close()
+
+
+##################################
+# Overrides single plugin parameters for a test.
+def plugin_config(**values):
+    plugins_config = dict(settings.PLUGINS_CONFIG)
+    plugins_config['netbox_qrcode'] = {**plugins_config.get('netbox_qrcode', {}), **values}
+    return override_settings(PLUGINS_CONFIG=plugins_config)
+
+
+class PrinterConnectionTestCase(SimpleTestCase):
+
+    def setUp(self):
+        printers._channels.clear()
+
+    def tearDown(self):
+        for channel in printers._channels.values():
+            for connection in channel.idle:
+                connection.close()
+        printers._channels.clear()
+
+    def start_printer(self, **kwargs):
+        printer = FakePrinter(**kwargs)
+        self.addCleanup(printer.stop)
+        return {'BACKEND': 'network', 'ADDRESS': printer.address, 'MODEL': 'QL-820NWB'}, printer
+
+    @plugin_config(printer_keepalive=10)
+    def test_connection_reused(self):
+        p_cfg, printer = self.start_printer()
+
+        write_to_printer('reuse', p_cfg, b'first')
+        write_to_printer('reuse', p_cfg, b'second')
+
+        self.assertEqual(printer.wait_for(11), b'firstsecond')
+        self.assertEqual(len(printer.connections), 1)
+
+    @plugin_config(printer_keepalive=10)
+    def test_reconnect_after_printer_closed(self):
+        p_cfg, printer = self.start_printer(close_after=5)
+
+        write_to_printer('reconnect', p_cfg, b'first')
+        self.assertTrue(printer.closed.wait(5))
+        write_to_printer('reconnect', p_cfg, b'again')
+
+        self.assertEqual(printer.wait_for(10), b'firstagain')
+        self.assertEqual(len(printer.connections), 2)
+
+    @plugin_config(printer_keepalive=0)
+    def test_no_keepalive(self):
+        p_cfg, printer = self.start_printer()
+
+        write_to_printer('no_keepalive', p_cfg, b'first')
+        write_to_printer('no_keepalive', p_cfg, b'second')
+
+        self.assertEqual(printer.wait_for(11), b'firstsecond')
+        self.assertEqual(len(printer.connections), 2)
+        self.assertEqual(printers._channels['no_keepalive'].idle, [])
+
+    @plugin_config(printer_max_jobs=1, printer_queue_timeout=0.2)
+    def test_printer_busy_after_queue_timeout(self):
+        p_cfg, printer = self.start_printer()
+
+        channel = printers._get_channel('busy', p_cfg)
+        channel.slots.acquire() # A running job
+        try:
+            started = time.monotonic()
+            with self.assertRaises(PrinterBusy):
+                write_to_printer('busy', p_cfg, b'label')
+            self.assertGreaterEqual(time.monotonic() - started, 0.2)
+        finally:
+            channel.slots.release()
+
+        self.assertEqual(printer.connections, [])
+
+    @plugin_config(printer_write_timeout=0.5)
+    def test_write_timeout(self):
+        p_cfg, printer = self.start_printer(read=False)
+
+        started = time.monotonic()
+        with self.assertRaises(socket.timeout):
+            write_to_printer('timeout', p_cfg, b'x' * 64 * 1024 * 1024)
+        self.assertLess(time.monotonic() - started, 5)
+
+        # The broken connection is not kept for the next job, the slot is free again.
+        channel = printers._channels['timeout']
+        self.assertEqual(channel.idle, [])
+        self.assertTrue(channel.slots.acquire(timeout=0))
+        channel.slots.release()
@@ -0,0 +1,63 @@
+from collections.abc import Mapping
+
+from django.core.exceptions import ImproperlyConfigured
+
+# ******************************************************************************************
+# Compiled accessors for the entries of 'text_fields'.
+# An entry like 'a_terminations.device.site.name' is split once at startup into its hops.
+# Each hop is resolved with a single lookup depending on the current value:
+#   - dict (e.g. custom fields 'cf.my_field'):  value.get(hop)
+#   - list / related manager:                   first element, then its attribute
+#   - any other object:                         getattr(value, hop)
+# ******************************************************************************************
+
+##################################
+# Accessor for one entry of 'text_fields'.
+class TextFieldAccessor:
+
+    __slots__ = ('spec', 'hops')
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.hops = tuple(spec.split('.'))
+
+        if not all(self.hops):
+            raise ImproperlyConfigured(f"netbox_qrcode: invalid entry '{spec}' in 'text_fields'.")
+
+    ##################################
+    # Returns the value of the field for an object or None if a hop has no value.
+    # --------------------------------
+    # Parameter:
+    #   obj: Data from the model (e.g. device, rack, etc.)
+    def __call__(self, obj):
+        value = getattr(obj, self.hops[0], None)
+
+        for hop in self.hops[1:]:
+            if not value:
+                return None
+            if isinstance(value, Mapping):
+                value = value.get(hop)
+            else:
+                value = getattr(first_element(value), hop, None)
+
+        return value or None
+
+    def __repr__(self):
+        return f'<TextFieldAccessor {self.spec}>'
+
+##################################
+# Returns the first element of a list or related manager, other values are returned unchanged.
+def first_element(value):
+    if isinstance(value, (list, tuple)):
+        return next(iter(value), None)
+    if callable(getattr(value, 'all', None)):
+        return next(iter(value.all()), None) # Related manager (e.g. tags)
+    return value
+
+##################################
+# Compiles all entries of 'text_fields'.
+# --------------------------------
+# Parameter:
+#   text_fields: List from the configuration (e.g. ['name', 'serial'])
+def compile_text_fields(text_fields):
+    return tuple(TextFieldAccessor(spec) for spec in text_fields)
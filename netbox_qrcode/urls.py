@@ -0,0 +1,12 @@
+from django.urls import path
+
+from . import views
+
+urlpatterns = [
+    path('label/<str:model_name>/<int:pk>/<int:label_design_no>/', views.LabelView.as_view(), name='label'),
+    path('label/<str:model_name>/<int:pk>/<int:label_design_no>/label.png', views.LabelPreviewView.as_view(kind='png'), name='label_png'),
+    path('label/<str:model_name>/<int:pk>/<int:label_design_no>/label.pdf', views.LabelPreviewView.as_view(kind='pdf'), name='label_pdf'),
+    path('bulk-print/<str:model_name>/', views.BulkPrintView.as_view(), name='bulk_print'),
+    path('export/<str:model_name>/<int:label_design_no>/labels.<str:archive>', views.ExportView.as_view(), name='export'),
+    path('print-job/<str:job_id>/', views.PrintJobView.as_view(), name='print_job'),
+]
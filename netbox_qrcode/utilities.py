@@ -1,7 +1,8 @@
 import base64
+import struct
+import zlib
 import qrcode
 from io import BytesIO
-from PIL import Image, ImageDraw, ImageFont
 
 # ******************************************************************************************
 # Includes useful tools to create the content.
@@ -22,11 +23,98 @@ def get_qr(text, **kwargs):
     return img
 
 ##################################          
-# Converts an image to Base64
+# Converts an image to PNG bytes
 # --------------------------------
 # Parameter:
 #   img: Image file
-def get_img_b64(img):
+def get_png(img):
     stream = BytesIO()
     img.save(stream, format='png')
-    return str(base64.b64encode(stream.getvalue()), encoding='ascii')
+    return stream.getvalue()
+
+##################################          
+# Converts an image to Base64
+# --------------------------------
+# Parameter:
+#   img: Image file
+def get_img_b64(img):
+    return str(base64.b64encode(get_png(img)), encoding='ascii')
+
+##################################          
+# Creates the module matrix of a QR code (True = dark module), including the border.
+# --------------------------------
+# Parameter:
+#   text: Text to be included in the QR code.
+#   **kwargs: List of parameters which properties the QR code should have. (e.g. version, box_size, error_correction, border etc.)
+def get_qr_matrix(text, **kwargs):
+    qr = qrcode.QRCode(**kwargs)
+    qr.add_data(text)
+    qr.make(fit=True)
+    return qr.get_matrix()
+
+##################################          
+# Encodes a QR code matrix as a minimal PNG: one pixel per module, 1 bit per pixel
+# (grayscale, 0 = dark), without Pillow. Scaling is left to the browser/renderer
+# (CSS image-rendering: pixelated), so the image only contains the information of the matrix.
+# --------------------------------
+# Parameter:
+#   matrix: Module matrix from get_qr_matrix()
+# Return:
+#   Base64 PNG image
+def get_png_1bit(matrix):
+    size = len(matrix)
+    row_bytes = (size + 7) // 8
+
+    raw = bytearray()
+    for row in matrix:
+        raw.append(0) # Filter type None: the rows are already tiny, other filters do not pay off
+        bits = 0
+        for module in row:
+            bits = (bits << 1) | (not module)
+        raw += (bits << (row_bytes * 8 - size)).to_bytes(row_bytes, 'big')
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    png = (
+        b'\x89PNG\r\n\x1a\n'
+        + chunk(b'IHDR', struct.pack('>IIBBBBB', size, size, 1, 0, 0, 0, 0))
+        + chunk(b'IDAT', zlib.compress(bytes(raw), 9))
+        + chunk(b'IEND', b'')
+    )
+    return str(base64.b64encode(png), encoding='ascii')
+
+##################################          
+# Converts a QR code matrix into a compact inline SVG.
+# All dark modules are merged into one path: adjacent modules of a row are drawn as one
+# stroked run (1 module high), the runs of a row are connected with relative moves.
+# The SVG scales to the size of the surrounding element (like the PNG with object-fit: fill).
+# --------------------------------
+# Parameter:
+#   matrix: Module matrix from get_qr_matrix()
+def get_svg(matrix):
+    size = len(matrix)
+    path = []
+
+    for y, row in enumerate(matrix):
+        pen = None # x position of the pen in this row (None = not yet in this row)
+        x = 0
+        while x < size:
+            if row[x]:
+                start = x
+                while x < size and row[x]:
+                    x += 1
+                if pen is None:
+                    path.append(f'M{start} {y}.5h{x - start}')
+                else:
+                    path.append(f'm{start - pen} 0h{x - start}')
+                pen = x
+            else:
+                x += 1
+
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}" '
+        'preserveAspectRatio="none" shape-rendering="crispEdges" style="width:100%; height:100%; display:block;">'
+        f'<path d="{"".join(path)}" stroke="#000" stroke-width="1"/>'
+        '</svg>'
+    )
@@ -0,0 +1,197 @@
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.context_processors import PermWrapper
+from django.contrib import messages
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.http import Http404, HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404, redirect
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag, url_has_allowed_host_and_scheme
+from django.views.generic import View
+from utilities.views import ConditionalLoginRequiredMixin
+
+from .export import export_labels, get_label_cache_key, get_label_file
+from .jobs import enqueue_print_job, get_job_status, DONE, FAILED
+from .signals import get_label_key
+from .template_content import QRCode, template_extensions
+from .template_content_functions import config_for_modul
+
+# ******************************************************************************************
+# Views of the plugin, e.g. to load labels separately from the detail page of the object.
+# ******************************************************************************************
+
+##################################
+# Finds the template extension (e.g. DeviceQRCode) for a model name such as 'device'.
+# --------------------------------
+# Parameter:
+#   model_name: Model name without app label (e.g. device, rack, etc.)
+def get_template_extension(model_name):
+    for extension in template_extensions:
+        if extension.models[0] == 'dcim.' + model_name:
+            return extension
+    raise Http404(f"No label available for model '{model_name}'.")
+
+##################################
+# Creates a template extension for an object outside of the NetBox detail page.
+# The context corresponds to the one NetBox passes to the plugin on the detail page.
+# --------------------------------
+# Parameter:
+#   request: HTML Request Information
+#   extension: Template extension class (e.g. DeviceQRCode)
+#   obj: Data from the model (e.g. device, rack, etc.)
+def create_plugin_instance(request, extension, obj):
+    return extension({
+        'object': obj,
+        'request': request,
+        'settings': settings,
+        'perms': PermWrapper(request.user),
+        'config': settings.PLUGINS_CONFIG.get('netbox_qrcode', {}),
+    })
+
+##################################
+# Creates the template extension for one object the user is allowed to view.
+# --------------------------------
+# Parameter:
+#   request: HTML Request Information
+#   model_name: Model name without app label (e.g. device, rack, etc.)
+#   pk: ID of the object
+def get_plugin_instance(request, model_name, pk):
+    extension = get_template_extension(model_name)
+    model = apps.get_model('dcim', model_name)
+
+    # Only objects the user is allowed to view.
+    obj = get_object_or_404(model.objects.restrict(request.user, 'view'), pk=pk)
+
+    return create_plugin_instance(request, extension, obj)
+
+##################################
+# Creates the template extensions for several objects with one query (e.g. bulk printing).
+# Objects the user is not allowed to view are skipped.
+# --------------------------------
+# Parameter:
+#   request: HTML Request Information
+#   model_name: Model name without app label (e.g. device, rack, etc.)
+#   pks: IDs of the objects
+def get_plugin_instances(request, model_name, pks):
+    extension = get_template_extension(model_name)
+    model = apps.get_model('dcim', model_name)
+
+    objs = model.objects.restrict(request.user, 'view').in_bulk(pks)
+
+    return [create_plugin_instance(request, extension, objs[pk]) for pk in pks if pk in objs]
+
+##################################
+# Returns the plug-in view of one label (see 'lazy_load').
+class LabelView(ConditionalLoginRequiredMixin, View):
+
+    def get(self, request, model_name, pk, label_design_no):
+        plugin = get_plugin_instance(request, model_name, pk)
+        return HttpResponse(QRCode.Create_SubPluginContent(plugin, label_design_no))
+
+##################################
+# Returns the rendered label as PNG or PDF file (preview).
+# ETag and Last-Modified are derived from the object and the label configuration, so
+# browsers and proxies only load the label again if something has changed (304 Not Modified).
+class LabelPreviewView(ConditionalLoginRequiredMixin, View):
+    kind = 'png'
+    content_types = {
+        'png': 'image/png',
+        'pdf': 'application/pdf',
+    }
+
+    def get(self, request, model_name, pk, label_design_no):
+        plugin = get_plugin_instance(request, model_name, pk)
+        obj = plugin.context['object']
+
+        config = config_for_modul(plugin, label_design_no)
+        if config is None:
+            raise Http404(f"Label design {label_design_no} is not configured for '{model_name}'.")
+
+        from .printing import _get_printer_cfg
+
+        # The version changes with the object, the objects in its label text and the label
+        # configuration (see signals.py). The host is part of the QR code URL, the label code
+        # determines the page size.
+        last_updated = getattr(obj, 'last_updated', None)
+        _, label_code = _get_printer_cfg()
+        etag = get_label_cache_key(
+            get_label_key(obj, config, label_design_no, request.get_host()), label_code, self.kind
+        )
+        last_modified = int(last_updated.timestamp()) if last_updated else None
+
+        response = get_conditional_response(request, etag=quote_etag(etag), last_modified=last_modified)
+        if response is None:
+            content = get_label_file(request, plugin, label_design_no, self.kind)
+            response = HttpResponse(content, content_type=self.content_types[self.kind])
+            response['Content-Disposition'] = f'inline; filename="{model_name}_{pk}_{label_design_no}.{self.kind}"'
+
+        response['ETag'] = quote_etag(etag)
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified)
+
+        # Always revalidate, the label depends on the permissions of the user.
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+##################################
+# Returns the status of a print job as JSON (queued, rendering, sending, done, failed).
+class PrintJobView(ConditionalLoginRequiredMixin, View):
+
+    def get(self, request, job_id):
+        job = get_job_status(job_id)
+
+        # Only the user who created the job may see it. Jobs of anonymous users (user_id None)
+        # are not shown to anyone who is not logged in, the job id alone is no proof.
+        if (
+            job is None
+            or (job.get('user_id') is None and not request.user.is_authenticated)
+            or (job.get('user_id') != request.user.pk and not request.user.is_superuser)
+        ):
+            raise Http404(f"Print job '{job_id}' not found.")
+
+        return JsonResponse(job)
+
+##################################
+# Prints the labels of the objects selected in a list view (e.g. device list) as one print job.
+# Printing always needs a logged-in user (like the print jobs of the REST API).
+class BulkPrintView(LoginRequiredMixin, View):
+
+    def post(self, request, model_name):
+        get_template_extension(model_name) # 404 for models without labels
+
+        try:
+            pks = [int(pk) for pk in request.POST.getlist('pk')]
+            label_design_no = int(request.POST.get('label_design_no', 1))
+        except ValueError:
+            raise Http404("Invalid selection.")
+
+        # Only objects the user may view are printed (see get_plugin_instances)
+        visible = set(
+            apps.get_model('dcim', model_name).objects.restrict(request.user, 'view')
+            .filter(pk__in=pks).values_list('pk', flat=True)
+        )
+        pks = [pk for pk in pks if pk in visible]
+
+        if not pks:
+            messages.warning(request, "Keine Objekte ausgewählt.")
+        else:
+            job = enqueue_print_job(request, model_name, pks, label_design_no)
+            if job['status'] == DONE:
+                messages.success(request, f"{job.get('label_count', len(pks))} Labels wurden gedruckt.")
+            elif job['status'] == FAILED:
+                messages.error(request, f"Druckfehler: {job.get('error')}")
+            else:
+                messages.info(request, f"Druckauftrag für {len(pks)} Labels wurde eingereiht.")
+
+        return_url = request.POST.get('return_url')
+        if not url_has_allowed_host_and_scheme(return_url, allowed_hosts={request.get_host()}):
+            return_url = '/'
+        return redirect(return_url)
+
+##################################
+# Exports the labels of all objects of the list view (with its filters, e.g. ?site_id=1) or
+# of the selected objects (?id=1&id=2) as ZIP archive (?output=png, qr.svg, ...) or as one PDF.
+class ExportView(ConditionalLoginRequiredMixin, View):
+
+    def get(self, request, model_name, label_design_no, archive):
+        return export_labels(request, model_name, label_design_no, archive, request.GET.get('output', 'png'))